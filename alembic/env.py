@@ -14,6 +14,7 @@ from app.database import Base
 from app.models.user import User 
 from app.models.product import Product
 from app.models.cart import CartItem
+from app.models.stats import ProductCategoryCounter
 
 # Импортируем enum для корректной работы миграций
 from app.models.user import UserRole
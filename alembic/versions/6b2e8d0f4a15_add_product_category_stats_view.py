@@ -0,0 +1,39 @@
+"""add_product_category_stats_view
+
+Revision ID: 6b2e8d0f4a15
+Revises: d4f1a9c27e63
+Create Date: 2026-10-16 15:12:47.905116
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6b2e8d0f4a15'
+down_revision: Union[str, Sequence[str], None] = 'd4f1a9c27e63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("""
+        CREATE MATERIALIZED VIEW product_category_stats AS
+        SELECT category,
+               count(*) AS product_count,
+               count(*) FILTER (WHERE is_active) AS active_count,
+               coalesce(sum(stock) FILTER (WHERE is_active), 0) AS active_stock,
+               count(*) FILTER (WHERE is_active AND stock < 10) AS low_stock_count
+        FROM products
+        GROUP BY category
+    """)
+    # Уникальный индекс нужен для REFRESH MATERIALIZED VIEW CONCURRENTLY
+    op.execute("CREATE UNIQUE INDEX ux_product_category_stats_category ON product_category_stats (category)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS product_category_stats")
@@ -0,0 +1,46 @@
+"""add_product_category_counters
+
+Revision ID: 8c3f5e1d7b42
+Revises: 6b2e8d0f4a15
+Create Date: 2026-10-16 15:48:02.337150
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c3f5e1d7b42'
+down_revision: Union[str, Sequence[str], None] = '6b2e8d0f4a15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('product_category_counters',
+    sa.Column('category', sa.String(length=50), nullable=False),
+    sa.Column('product_count', sa.Integer(), nullable=False),
+    sa.Column('active_count', sa.Integer(), nullable=False),
+    sa.Column('active_stock', sa.Integer(), nullable=False),
+    sa.Column('low_stock_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('category')
+    )
+    op.execute("""
+        INSERT INTO product_category_counters
+            (category, product_count, active_count, active_stock, low_stock_count)
+        SELECT category,
+               count(*),
+               count(*) FILTER (WHERE is_active),
+               coalesce(sum(stock) FILTER (WHERE is_active), 0),
+               count(*) FILTER (WHERE is_active AND stock < 10)
+        FROM products
+        GROUP BY category
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('product_category_counters')
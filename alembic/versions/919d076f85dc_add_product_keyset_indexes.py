@@ -0,0 +1,36 @@
+"""add_product_keyset_indexes
+
+Revision ID: 919d076f85dc
+Revises: 1b338cba5d2e
+Create Date: 2026-10-16 10:12:41.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '919d076f85dc'
+down_revision: Union[str, Sequence[str], None] = '1b338cba5d2e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_products_created_at_id', 'products', ['created_at', 'id'])
+    op.create_index('ix_products_active_created_at_id', 'products', ['is_active', 'created_at', 'id'])
+    op.create_index(
+        'ix_products_category_active_created_at_id',
+        'products',
+        ['category', 'is_active', 'created_at', 'id']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_category_active_created_at_id', table_name='products')
+    op.drop_index('ix_products_active_created_at_id', table_name='products')
+    op.drop_index('ix_products_created_at_id', table_name='products')
@@ -0,0 +1,48 @@
+"""add_cart_items_user_product_unique
+
+Revision ID: a3d81f6c0b27
+Revises: 5c0e7a4b2f19
+Create Date: 2026-10-16 12:20:09.662431
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3d81f6c0b27'
+down_revision: Union[str, Sequence[str], None] = '5c0e7a4b2f19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Схлопываем дубликаты: количество суммируется в первую строку, остальные удаляются
+    op.execute("""
+        WITH ranked AS (
+            SELECT id,
+                   SUM(quantity) OVER (PARTITION BY user_id, product_id) AS total,
+                   ROW_NUMBER() OVER (PARTITION BY user_id, product_id ORDER BY id) AS rn
+            FROM cart_items
+        )
+        UPDATE cart_items c SET quantity = ranked.total
+        FROM ranked
+        WHERE c.id = ranked.id AND ranked.rn = 1
+    """)
+    op.execute("""
+        DELETE FROM cart_items c
+        USING (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id, product_id ORDER BY id) AS rn
+            FROM cart_items
+        ) ranked
+        WHERE c.id = ranked.id AND ranked.rn > 1
+    """)
+    op.create_unique_constraint('uq_cart_items_user_product', 'cart_items', ['user_id', 'product_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_cart_items_user_product', 'cart_items', type_='unique')
@@ -0,0 +1,63 @@
+"""align_product_stats_predicates
+
+Revision ID: b7e2c4a91d36
+Revises: 8c3f5e1d7b42
+Create Date: 2026-10-16 18:20:31.604822
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2c4a91d36'
+down_revision: Union[str, Sequence[str], None] = '8c3f5e1d7b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Товар с is_active IS NULL неактивен, stock IS NULL - нулевой запас:
+# так же считают живой запрос и приращения счетчиков
+STATS_SELECT = """
+    SELECT category,
+           count(*) AS product_count,
+           count(*) FILTER (WHERE is_active IS TRUE) AS active_count,
+           coalesce(sum(coalesce(stock, 0)) FILTER (WHERE is_active IS TRUE), 0) AS active_stock,
+           count(*) FILTER (WHERE is_active IS TRUE AND coalesce(stock, 0) < 10) AS low_stock_count
+    FROM products
+    GROUP BY category
+"""
+
+OLD_STATS_SELECT = """
+    SELECT category,
+           count(*) AS product_count,
+           count(*) FILTER (WHERE is_active) AS active_count,
+           coalesce(sum(stock) FILTER (WHERE is_active), 0) AS active_stock,
+           count(*) FILTER (WHERE is_active AND stock < 10) AS low_stock_count
+    FROM products
+    GROUP BY category
+"""
+
+
+def _recreate(select_sql: str) -> None:
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS product_category_stats")
+    op.execute(f"CREATE MATERIALIZED VIEW product_category_stats AS {select_sql}")
+    # Уникальный индекс нужен для REFRESH MATERIALIZED VIEW CONCURRENTLY
+    op.execute("CREATE UNIQUE INDEX ux_product_category_stats_category ON product_category_stats (category)")
+    op.execute("DELETE FROM product_category_counters")
+    op.execute(f"""
+        INSERT INTO product_category_counters
+            (category, product_count, active_count, active_stock, low_stock_count)
+        {select_sql}
+    """)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _recreate(STATS_SELECT)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _recreate(OLD_STATS_SELECT)
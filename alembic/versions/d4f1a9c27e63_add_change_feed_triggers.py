@@ -0,0 +1,80 @@
+"""add_change_feed_triggers
+
+Revision ID: d4f1a9c27e63
+Revises: a3d81f6c0b27
+Create Date: 2026-10-16 14:05:31.218604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4f1a9c27e63'
+down_revision: Union[str, Sequence[str], None] = 'a3d81f6c0b27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Таблица -> колонки, попадающие в уведомление (NOTIFY ограничен 8000 байт,
+# поэтому строка целиком не передается)
+TRIGGER_COLUMNS = {
+    'products': ['id', 'name', 'sku', 'category', 'is_active', 'image_object_name'],
+    'users': ['id', 'email'],
+    'cart_items': ['id', 'user_id'],
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Уведомление в канал app_changes: таблица, операция, старые и новые значения
+    # колонок из аргументов триггера и источник изменения (app.change_source)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_app_change() RETURNS trigger AS $$
+        DECLARE
+            old_row jsonb;
+            new_row jsonb;
+            old_data jsonb := NULL;
+            new_data jsonb := NULL;
+            col text;
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                old_row := to_jsonb(OLD);
+                old_data := '{}'::jsonb;
+                FOREACH col IN ARRAY TG_ARGV LOOP
+                    old_data := old_data || jsonb_build_object(col, old_row -> col);
+                END LOOP;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                new_row := to_jsonb(NEW);
+                new_data := '{}'::jsonb;
+                FOREACH col IN ARRAY TG_ARGV LOOP
+                    new_data := new_data || jsonb_build_object(col, new_row -> col);
+                END LOOP;
+            END IF;
+            PERFORM pg_notify('app_changes', jsonb_build_object(
+                'table', TG_TABLE_NAME,
+                'op', TG_OP,
+                'old', old_data,
+                'new', new_data,
+                'source', NULLIF(current_setting('app.change_source', true), '')
+            )::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for table, columns in TRIGGER_COLUMNS.items():
+        args = ", ".join(f"'{column}'" for column in columns)
+        op.execute(f"""
+            CREATE TRIGGER {table}_notify_change
+            AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION notify_app_change({args})
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TRIGGER_COLUMNS:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_notify_change ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS notify_app_change()")
@@ -5,10 +5,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.security import (
     create_tokens,
     get_current_user,
-    validate_refresh_token,
-    verify_password
+    validate_refresh_token
 )
-from app.crud.user import get_user_by_email, create_user
+from app.crud.user import get_user_by_email, create_user, authenticate_user
 from app.schema.token import TokenPair
 from app.schema.user import UserCreate, UserInDB
 from app.database import get_db
@@ -20,8 +19,9 @@ async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: AsyncSession = Depends(get_db)
 ):
-    user = await get_user_by_email(db, form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    # Проверка пароля (и пересчет хеша при смене стоимости bcrypt) идет в пуле потоков
+    user = await authenticate_user(db, form_data.username, form_data.password)
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
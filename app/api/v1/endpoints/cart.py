@@ -2,32 +2,34 @@ from fastapi import APIRouter, Depends, HTTPException
 from typing import List
 import uuid
 
-from app.schema.cart import CartItemInDB, CartItemCreate, CartItemUpdate
+from app.schema.cart import CartItemInDB, CartItemCreate, CartItemUpdate, CartBatchRequest
 from app.crud.cart import (
     get_cart_items, add_to_cart, update_cart_item, 
-    remove_from_cart, clear_cart, get_cart_items_count
+    remove_from_cart, clear_cart, get_cart_items_count,
+    apply_cart_operations
 )
 from app.database import get_db
 
 from app.schema.user import UserInDB
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.dependencies import get_current_user
+from app.core.dependencies import get_current_user, get_cart_read_db
+from app.services.read_your_writes import read_your_writes
 
 router = APIRouter(prefix="/cart", tags=["cart"])
 
 @router.get("/", response_model=List[CartItemInDB])
 async def read_user_cart(
     current_user: UserInDB = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_cart_read_db)
 ):
-    """Получить корзину текущего пользователя"""
+    """Получить корзину текущего пользователя (с реплики)"""
     return await get_cart_items(db, current_user.id)
 
 @router.get("/count")
 async def get_cart_count(
     current_user: UserInDB = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_cart_read_db)
 ):
     """Получить общее количество товаров в корзине"""
     count = await get_cart_items_count(db, current_user.id)
@@ -40,7 +42,24 @@ async def add_item_to_cart(
     db: AsyncSession = Depends(get_db)
 ):
     """Добавить товар в корзину"""
-    return await add_to_cart(db, current_user.id, cart_item)
+    item = await add_to_cart(db, current_user.id, cart_item)
+    await read_your_writes.mark(current_user.id)
+    return item
+
+@router.post("/batch", response_model=List[CartItemInDB])
+async def apply_cart_batch(
+    batch: CartBatchRequest,
+    current_user: UserInDB = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Применить пакет операций (add/update/remove) к корзине одной транзакцией.
+
+    Операции применяются по порядку и адресуются по product_id.
+    Возвращает корзину после изменений.
+    """
+    items = await apply_cart_operations(db, current_user.id, batch.operations)
+    await read_your_writes.mark(current_user.id)
+    return items
 
 @router.put("/{cart_item_id}", response_model=CartItemInDB)
 async def update_cart_item_quantity(
@@ -53,6 +72,7 @@ async def update_cart_item_quantity(
     updated_item = await update_cart_item(db, cart_item_id, cart_item)
     if not updated_item:
         raise HTTPException(status_code=404, detail="Cart item not found")
+    await read_your_writes.mark(current_user.id)
     return updated_item
 
 @router.delete("/{cart_item_id}")
@@ -65,6 +85,7 @@ async def remove_item_from_cart(
     success = await remove_from_cart(db, cart_item_id)
     if not success:
         raise HTTPException(status_code=404, detail="Cart item not found")
+    await read_your_writes.mark(current_user.id)
     return {"message": "Item removed from cart successfully"}
 
 @router.delete("/")
@@ -76,4 +97,5 @@ async def clear_user_cart(
     success = await clear_cart(db, current_user.id)
     if not success:
         raise HTTPException(status_code=404, detail="No items in cart")
+    await read_your_writes.mark(current_user.id)
     return {"message": "Cart cleared successfully"}
\ No newline at end of file
@@ -1,18 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Dict, Literal, Tuple
+from datetime import datetime, timezone
 import uuid
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.schema.product import ProductInDB, ProductCreate, ProductUpdate
+from app.schema.product import (
+    ProductInDB, ProductCreate, ProductUpdate, ProductPage, AutocompleteSuggestion, ProductImportReport,
+    ProductBulkUpdate, ProductBulkDelete, ProductBulkResult
+)
 from app.crud.product import (
     get_product, get_products, create_product_with_image,
     update_product, delete_product, toggle_product_activity,
     update_product_image, get_products_by_category, search_products,
-    create_product
+    create_product, get_products_page, PRODUCT_ORDER,
+    bulk_update_products, bulk_delete_products, get_products_by_ids, serialize_products,
+    stream_products
 )
-from app.database import get_db
+from app.core.config import settings
+from app.database import get_db, get_read_db
 from app.services.file_storage import file_storage
+from app.services.autocomplete import autocomplete_index
+from app.services.product_cache import product_cache, product_tag, category_tag, LIST_TAG
+from app.utils.http_cache import make_etag, is_not_modified, not_modified, set_validators
+from app.utils.serialization import model_response, stream_response
+from app.utils.record_stream import iter_csv_records, iter_ndjson_records
 from app.models.product import Product
+from app.crud.product_io import import_products, export_products
 from app.crud.stats import get_product_stats, get_category_stats
 from app.schema.stats import ProductStats, CategoryStats
 from app.core.dependencies import get_current_admin_user, get_current_user
@@ -20,33 +34,145 @@ from app.schema.user import UserInDB, UserRole
 
 router = APIRouter(prefix="/products", tags=["products"])
 
+# Форматы массового импорта/экспорта и их типы содержимого
+TRANSFER_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
 # Публичные эндпоинты
+def _validators(modified_at: datetime, *parts) -> Tuple[str, datetime]:
+    """ETag и Last-Modified ответа с товарами.
+
+    В ответе есть presigned URL изображений, которые истекают, поэтому
+    в валидаторы входит окно выдачи URL: после его смены клиент получает
+    ответ с новыми URL, а не 304 на старый.
+    """
+    url_epoch = file_storage.url_epoch(settings.PRODUCT_CACHE_TTL + settings.PRODUCT_CACHE_STALE_TTL)
+    if url_epoch is None:
+        return make_etag(*parts), modified_at
+    if modified_at.tzinfo is None:
+        modified_at = modified_at.replace(tzinfo=timezone.utc)
+    return make_etag(*parts, url_epoch.isoformat()), max(modified_at, url_epoch)
+
 @router.get("/", response_model=List[ProductInDB])
 async def read_products(
+    request: Request,
+    response: Response,
     skip: int = 0, 
     limit: int = 100,
     category: Optional[str] = None,
-    search: Optional[str] = None,
-    db: AsyncSession = Depends(get_db)
-):
-    """Получить список товаров (публичный)"""
-    if category:
-        return await get_products_by_category(db, category, skip, limit)
-    elif search:
-        return await search_products(db, search, skip, limit)
-    else:
-        return await get_products(db, skip, limit)
+    search: Optional[str] = None
+):
+    """Получить список товаров (публичный).
+
+    Поддерживает If-None-Match / If-Modified-Since по версии каталога.
+    """
+    version = await product_cache.version()
+    if version:
+        token, changed_at = version
+        etag, changed_at = _validators(changed_at, "list", token, skip, limit, category, search)
+        if is_not_modified(request, etag, changed_at):
+            return not_modified(etag, changed_at)
+        set_validators(response, etag, changed_at)
+
+    async def load(session: AsyncSession):
+        if category:
+            return await get_products_by_category(session, category, skip, limit)
+        elif search:
+            return await search_products(session, search, skip, limit)
+        else:
+            return await get_products(session, skip, limit)
+
+    products = await product_cache.get_or_load(
+        "list",
+        {"skip": skip, "limit": limit, "category": category, "search": search},
+        load,
+        List[ProductInDB],
+        tags=[category_tag(category)] if category else [LIST_TAG]
+    )
+    return model_response(products, List[ProductInDB], response)
+
+@router.get("/page", response_model=ProductPage)
+async def read_products_page(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    category: Optional[str] = None,
+    search: Optional[str] = None
+):
+    """Получить страницу товаров по курсору (публичный).
+
+    Для следующей страницы передайте next_cursor из предыдущего ответа.
+    """
+    version = await product_cache.version()
+    if version:
+        token, changed_at = version
+        etag, changed_at = _validators(changed_at, "page", token, cursor, limit, category, search)
+        if is_not_modified(request, etag, changed_at):
+            return not_modified(etag, changed_at)
+        set_validators(response, etag, changed_at)
+
+    page = await product_cache.get_or_load(
+        "page",
+        {"cursor": cursor, "limit": limit, "category": category, "search": search},
+        lambda session: get_products_page(session, cursor, limit, category=category, search=search),
+        ProductPage,
+        tags=[category_tag(category)] if category else [LIST_TAG]
+    )
+    return model_response(page, ProductPage, response)
+
+@router.get("/autocomplete", response_model=List[AutocompleteSuggestion])
+async def autocomplete_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50)
+):
+    """Подсказки при вводе поискового запроса (публичный, без обращения к БД)"""
+    return autocomplete_index.search(q, limit)
+
+@router.get("/batch", response_model=List[ProductInDB])
+async def read_products_batch(
+    ids: List[uuid.UUID] = Query(..., max_length=settings.PRODUCT_BATCH_MAX_IDS)
+):
+    """Получить несколько товаров по ID одним запросом (публичный).
+
+    Товары, уже лежащие в кэше, отдаются без обращения к БД, остальные
+    загружаются одним SELECT ... WHERE id = ANY(...). Порядок ответа -
+    порядок ids, несуществующие id пропускаются.
+    """
+    ids = list(dict.fromkeys(ids))
+    products = await product_cache.get_items(ids, get_products_by_ids, ProductInDB)
+    return model_response(
+        [products[product_id] for product_id in ids if product_id in products],
+        List[ProductInDB]
+    )
 
 @router.get("/{product_id}", response_model=ProductInDB)
 async def read_product(
     product_id: uuid.UUID,
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    response: Response
 ):
-    """Получить товар по ID (публичный)"""
-    product = await get_product(db, product_id)
+    """Получить товар по ID (публичный).
+
+    ETag и Last-Modified берутся из updated_at закэшированного товара:
+    сброс кэша при изменении товара меняет и их, а ответ 304 на попадание
+    в кэш не требует запроса к БД.
+    """
+    product = await product_cache.get_or_load(
+        "item",
+        {"product_id": product_id},
+        lambda session: get_product(session, product_id),
+        ProductInDB,
+        tags=[product_tag(product_id)]
+    )
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+
+    modified_at = product.updated_at or product.created_at
+    etag, modified_at = _validators(modified_at, product_id, modified_at.isoformat())
+    if is_not_modified(request, etag, modified_at):
+        return not_modified(etag, modified_at)
+    set_validators(response, etag, modified_at)
+    return model_response(product, ProductInDB, response)
 
 # Админские эндпоинты для управления товарами
 @router.post("/admin/", response_model=ProductInDB)
@@ -82,6 +208,28 @@ async def create_product_admin(
     else:
         return await create_product(db, product_data)
 
+@router.patch("/admin/bulk", response_model=ProductBulkResult)
+async def bulk_update_products_admin(
+    bulk: ProductBulkUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserInDB = Depends(get_current_admin_user)
+):
+    """Массово изменить товары по списку id или фильтру (только для админов).
+
+    Можно выставить поля, изменить цену на price_percent процентов
+    или переключить активность - все одним запросом к БД.
+    """
+    return await bulk_update_products(db, bulk)
+
+@router.post("/admin/bulk/delete", response_model=ProductBulkResult)
+async def bulk_delete_products_admin(
+    bulk: ProductBulkDelete,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserInDB = Depends(get_current_admin_user)
+):
+    """Массово удалить товары по списку id или фильтру (только для админов)"""
+    return await bulk_delete_products(db, bulk.where)
+
 @router.put("/admin/{product_id}", response_model=ProductInDB)
 async def update_product_admin(
     product_id: uuid.UUID,
@@ -148,31 +296,95 @@ async def delete_product_admin(
 @router.get("/admin/all", response_model=List[ProductInDB])
 async def get_all_products_admin(
     skip: int = 0,
-    limit: int = 100,
+    limit: Optional[int] = Query(None, ge=1),
     include_inactive: bool = False,
+    stream: Optional[Literal["ndjson", "json"]] = None,
     db: AsyncSession = Depends(get_db),
     current_user: UserInDB = Depends(get_current_admin_user)
 ):
-    """Получить все товары включая неактивные (только для админов)"""
+    """Получить все товары включая неактивные (только для админов).
+
+    stream=ndjson|json - потоковый ответ (NDJSON или JSON-массив) из
+    серверного курсора; без limit в этом режиме отдаются все товары.
+    Обычный ответ по умолчанию ограничен 100 товарами.
+    """
     from sqlalchemy import select
-    
+
+    if stream:
+        return stream_response(stream_products(include_inactive, skip, limit), ProductInDB, stream)
+    limit = limit or 100
+
     if include_inactive:
-        result = await db.execute(select(Product).offset(skip).limit(limit))
+        result = await db.execute(
+            select(Product).order_by(*PRODUCT_ORDER).offset(skip).limit(limit)
+        )
     else:
         result = await db.execute(
             select(Product)
             .filter(Product.is_active == True)
+            .order_by(*PRODUCT_ORDER)
             .offset(skip)
             .limit(limit)
         )
     
-    products = result.scalars().all()
-    return [await _add_image_url_to_product(product) for product in products]
+    return model_response(serialize_products(result.scalars().all()), List[ProductInDB])
+
+@router.get("/admin/all/page", response_model=ProductPage)
+async def get_all_products_page_admin(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    include_inactive: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserInDB = Depends(get_current_admin_user)
+):
+    """Получить страницу всех товаров по курсору (только для админов)"""
+    return await get_products_page(db, cursor, limit, active_only=not include_inactive)
+
+@router.post("/admin/import", response_model=ProductImportReport)
+async def import_products_admin(
+    request: Request,
+    format: Optional[Literal["csv", "ndjson"]] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserInDB = Depends(get_current_admin_user)
+):
+    """Массовый импорт товаров из CSV или NDJSON (только для админов).
+
+    Файл передается телом запроса (Content-Type: text/csv или
+    application/x-ndjson, либо параметр format) и читается потоково.
+    Товары с существующим sku обновляются, ошибки строк возвращаются в отчете.
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip()
+        format = next((fmt for fmt, media in TRANSFER_MEDIA_TYPES.items() if media == content_type), None)
+    if format is None:
+        raise HTTPException(
+            status_code=415,
+            detail="Send text/csv or application/x-ndjson, or pass the format parameter"
+        )
+
+    if format == "csv":
+        records = iter_csv_records(request.stream(), settings.PRODUCT_IMPORT_MAX_RECORD_SIZE)
+    else:
+        records = iter_ndjson_records(request.stream(), settings.PRODUCT_IMPORT_MAX_RECORD_SIZE)
+    return await import_products(db, records)
+
+@router.get("/admin/export")
+async def export_products_admin(
+    format: Literal["csv", "ndjson"] = "csv",
+    include_inactive: bool = True,
+    current_user: UserInDB = Depends(get_current_admin_user)
+):
+    """Потоковый экспорт всех товаров в CSV или NDJSON (только для админов)"""
+    return StreamingResponse(
+        export_products(format, include_inactive),
+        media_type=TRANSFER_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="products.{format}"'}
+    )
 
 # Эндпоинты для статистики
 @router.get("/admin/stats/products", response_model=ProductStats)
 async def get_products_stats_admin(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: UserInDB = Depends(get_current_admin_user)
 ):
     """Получить статистику по товарам (только для админов)"""
@@ -180,29 +392,8 @@ async def get_products_stats_admin(
 
 @router.get("/admin/stats/categories", response_model=List[CategoryStats])
 async def get_categories_stats_admin(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: UserInDB = Depends(get_current_admin_user)
 ):
     """Получить статистику по категориям (только для админов)"""
     return await get_category_stats(db)
-
-# Вспомогательная функция
-async def _add_image_url_to_product(product: Product) -> ProductInDB:
-    """Добавить URL изображения к данным продукта"""
-    product_dict = {
-        "id": product.id,
-        "name": product.name,
-        "description": product.description,
-        "price": product.price,
-        "stock": product.stock,
-        "is_active": product.is_active,
-        "category": product.category,
-        "sku": product.sku,
-        "weight": product.weight,
-        "dimensions": product.dimensions,
-        "image_object_name": product.image_object_name,
-        "created_at": product.created_at,
-        "updated_at": product.updated_at,
-        "image_url": file_storage.get_image_url(product.image_object_name) if product.image_object_name else None
-    }
-    return ProductInDB(**product_dict)
\ No newline at end of file
@@ -2,11 +2,13 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.schema.user import UserInDB, UserUpdate, UserRole
-from app.crud.user import get_user, get_users_by_role
+from app.crud.user import get_user, get_users_by_role, stream_users
 from app.database import get_db
 from app.core.dependencies import get_current_active_user, get_current_admin_user
+from app.services.user_cache import user_cache
+from app.utils.serialization import stream_response
 from uuid import UUID
-from typing import List
+from typing import List, Literal, Optional
 
 from app.models.user import User
 
@@ -36,12 +38,18 @@ async def read_user(
 @router.get("/users", response_model=List[UserInDB])
 async def read_users(
     role: UserRole = None,
+    stream: Optional[Literal["ndjson", "json"]] = None,
     db: AsyncSession = Depends(get_db),
     current_user: UserInDB = Depends(get_current_admin_user),
 ):
     """
     Получить список пользователей (только для админов)
+
+    stream=ndjson|json - потоковый ответ (NDJSON или JSON-массив) из
+    серверного курсора, память не зависит от числа пользователей.
     """
+    if stream:
+        return stream_response(stream_users(role), UserInDB, stream)
     if role:
         return await get_users_by_role(db, role)
     else:
@@ -69,6 +77,7 @@ async def update_user_role(
         )
     
 
+    old_email = user.email
     if user_update.email:
         user.email = user_update.email
     if user_update.role:
@@ -76,5 +85,10 @@ async def update_user_role(
     
     await db.commit()
     await db.refresh(user)
+
+    # Сбрасываем кэш аутентификации для старого и нового email
+    await user_cache.invalidate(old_email)
+    if user.email != old_email:
+        await user_cache.invalidate(user.email)
     
     return UserInDB.from_orm(user)
\ No newline at end of file
@@ -16,9 +16,45 @@ class Settings(BaseSettings):
     POSTGRES_DB: str = "auth_service"
     SQLALCHEMY_DATABASE_URI: Optional[str] = None
     
+    # Пул соединений к БД
+    DB_ECHO: bool = False
+    DB_USE_NULL_POOL: bool = False  # Без пула (новое соединение на каждую сессию)
+    DB_POOL_SIZE: int = 10  # Постоянных соединений на один воркер
+    DB_MAX_OVERFLOW: int = 20  # Дополнительных соединений сверх DB_POOL_SIZE
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800  # Секунд до пересоздания соединения
+    DB_POOL_TIMEOUT: float = 30.0  # Секунд ожидания свободного соединения
+
+    # Реплики для чтения (пусто - все запросы идут в основную БД)
+    DB_REPLICA_URIS: List[str] = []  # URI реплик, чтения распределяются по кругу
+    DB_READ_YOUR_WRITES_SECONDS: float = 5.0  # Столько секунд после записи чтения идут в основную БД
+    
     # Настройки Redis
     REDIS_URI: RedisDsn = "redis://redis:6379/0"
     
+    # Хранилище корзин: "postgres" или "redis" (Redis с отложенной записью в Postgres)
+    CART_STORE: str = "postgres"
+    CART_CACHE_TTL: int = 3600  # Секунд хранения сохраненной корзины в Redis
+    CART_FLUSH_INTERVAL: float = 2.0  # Период записи измененных корзин в Postgres
+    CART_FLUSH_BATCH: int = 500  # Корзин за одну запись
+    CART_FLUSH_TIMEOUT: float = 60.0  # Через сколько секунд незавершенная запись корзин повторяется
+    
+    # Сериализация значений в кэше (app/utils/cache.py)
+    CACHE_COMPRESS_THRESHOLD: int = 1024  # Сжимать значения больше этого размера (байт)
+    CACHE_COMPRESS_LEVEL: int = 1  # Уровень сжатия zlib
+    CACHE_L1_SIZE: int = 10000  # Записей в памяти воркера
+    CACHE_L1_TTL: float = 5.0  # Максимум секунд жизни записи в памяти воркера
+    CACHE_INVALIDATION_CHANNEL: str = "cache:invalidate"  # Префикс каналов pub/sub для сброса L1 во всех воркерах
+    PRODUCT_CACHE_TTL: int = 300  # Секунд свежести кэша каталога
+    PRODUCT_CACHE_STALE_TTL: int = 60  # Секунд отдачи устаревшего значения, пока оно обновляется
+    PRODUCT_CACHE_L1_TTL: float = 60.0  # Сбросы приходят через pub/sub, поэтому L1 может жить дольше
+    PRODUCT_BATCH_MAX_IDS: int = 100  # Максимум id в одном запросе GET /products/batch
+    
+    # Кэш пользователей для аутентификации
+    USER_CACHE_TTL: int = 300  # Секунд хранения в Redis
+    USER_CACHE_LOCAL_TTL: int = 30  # Секунд хранения в памяти воркера
+    USER_CACHE_SIZE: int = 10000  # Максимум пользователей в памяти воркера
+    
     # Настройки JWT
     SECRET_KEY: str = Field(default="7f0759f478c5be878db11d28d31b9a8fa14de0578139c9711ebf00ad76de98fb")
     REFRESH_SECRET_KEY: str = Field(default="7f0759f478c5be878db11d28d31b9a8fa14de0578139c9711ebf00ad76de98fb")
@@ -27,6 +63,11 @@ class Settings(BaseSettings):
     RESET_PASSWORD_TOKEN_EXPIRE_MINUTES: int = 15
     JWT_ALGORITHM: str = "HS256"
     
+    # Хеширование паролей
+    BCRYPT_ROUNDS: int = 12  # При изменении хеши пересчитываются при следующем входе
+    PASSWORD_HASH_WORKERS: int = 2  # Потоков для bcrypt на воркер
+    PASSWORD_HASH_MAX_PENDING: int = 32  # Максимум задач в очереди, сверх - 503
+    
     USE_ASYNC_MIGRATIONS: bool = False
     
     # OAuth провайдеры
@@ -45,6 +86,35 @@ class Settings(BaseSettings):
     MINIO_BUCKET_NAME: str = "kitchen-blocks"
     MINIO_PUBLIC_URL: str = "http://185.135.80.107:9000"
     MINIO_SECURE: bool = False  
+    MAX_IMAGE_SIZE: int = 10 * 1024 * 1024  # Максимальный размер изображения в байтах
+    UPLOAD_PART_SIZE: int = 5 * 1024 * 1024  # Размер части multipart-загрузки (минимум 5 МБ)
+    IMAGE_URL_EXPIRE_HOURS: int = 24  # Срок действия presigned URL
+    IMAGE_URL_REFRESH_MINUTES: int = 60  # Перевыпускать URL, если до истечения осталось меньше
+    IMAGE_URL_CACHE_SIZE: int = 10000  # Максимум закэшированных presigned URL
+
+    # Статистика товаров для админки
+    # "live" - запрос к products, "matview" - материализованное представление,
+    # "counters" - таблица счетчиков, обновляемая при записи товаров
+    PRODUCT_STATS_SOURCE: str = "live"
+    PRODUCT_STATS_REFRESH_SECONDS: int = 60  # Период обновления представления
+    PRODUCT_COUNTERS_RECONCILE_SECONDS: int = 600  # Период сверки счетчиков с products
+
+    # Массовый импорт и экспорт товаров
+    PRODUCT_IMPORT_BATCH_SIZE: int = 1000  # Строк в одном INSERT ... ON CONFLICT
+    PRODUCT_IMPORT_MAX_ERRORS: int = 1000  # Ошибок в отчете (остальные только считаются)
+    PRODUCT_IMPORT_MAX_RECORD_SIZE: int = 1 << 20  # Символов в одной строке NDJSON или записи CSV
+    PRODUCT_EXPORT_BATCH_SIZE: int = 1000  # Строк, читаемых из курсора за раз
+
+    # Потоковые ответы админских списков (GET /users, /products/admin/all)
+    LISTING_STREAM_BATCH_SIZE: int = 500  # Строк, читаемых из курсора и отправляемых за раз
+
+    # Лента изменений Postgres (LISTEN/NOTIFY)
+    CHANGE_FEED_ENABLED: bool = True  # Слушать NOTIFY об изменениях products/users/cart_items
+    CHANGE_FEED_KEEPALIVE: float = 30.0  # Секунд между проверками соединения слушателя
+    CHANGE_FEED_BATCH_SIZE: int = 1000  # Событий, применяемых за раз (один сброс кэша каталога на пачку)
+
+    # Автодополнение поиска
+    AUTOCOMPLETE_REFRESH_SECONDS: int = 300  # Период полной перестройки индекса (0 - отключить)
 
     ENVIRONMENT: str = "development"
     class Config:
@@ -2,29 +2,20 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Optional
-from fastapi_cache.decorator import cache
+from typing import AsyncGenerator
 
 from app.core.config import settings
-from app.crud.user import get_user_by_email
-from app.database import get_db
+from app.services.user_cache import user_cache
+from app.services.cart_store import cart_store
+from app.services.read_your_writes import read_your_writes
+from app.database import read_session
 from app.schema.token import TokenData
 from app.schema.user import UserInDB, UserRole
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
-# Кэшированная функция, которая возвращает данные пользователя в виде словаря
-@cache(expire=300)
-async def get_cached_user_data(email: str, db: AsyncSession) -> Optional[dict]:
-    """Получает данные пользователя и кэширует их в виде словаря"""
-    user = await get_user_by_email(db, email=email)
-    if user:
-        return user.to_dict()  # Используем метод to_dict для сериализации
-    return None
-
 async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: AsyncSession = Depends(get_db)
+    token: str = Depends(oauth2_scheme)
 ) -> UserInDB:
     """
     Получает текущего пользователя по JWT токену с кешированием
@@ -44,25 +35,11 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    # Пытаемся получить данные из кэша
-    user_data = await get_cached_user_data(token_data.email, db)
-    
-    if user_data is not None:
-        try:
-            # Преобразуем словарь обратно в UserInDB
-            return UserInDB.from_dict(user_data)
-        except Exception as e:
-            # Если преобразование не удалось, получаем из базы
-            user = await get_user_by_email(db, token_data.email)
-            if user is None:
-                raise credentials_exception
-            return user
-    else:
-        # Если нет в кэше, получаем из базы
-        user = await get_user_by_email(db, token_data.email)
-        if user is None:
-            raise credentials_exception
-        return user
+    # Локальный кэш -> Redis -> БД
+    user = await user_cache.get(token_data.email)
+    if user is None:
+        raise credentials_exception
+    return user
 
 async def get_current_active_user(
     current_user: UserInDB = Depends(get_current_user)
@@ -84,4 +61,16 @@ async def get_current_admin_user(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Admin privileges required"
         )
-    return current_user
\ No newline at end of file
+    return current_user
+
+async def get_cart_read_db(
+    current_user: UserInDB = Depends(get_current_user)
+) -> AsyncGenerator[AsyncSession, None]:
+    """Сессия для чтения корзины: реплика, кроме окна после изменения корзины.
+
+    Хранилище корзин в Redis подгружает корзину из БД и держит ее у себя,
+    поэтому с ним корзина всегда читается с основной БД.
+    """
+    primary = cart_store.enabled or await read_your_writes.use_primary(current_user.id)
+    async with read_session(primary=primary) as session:
+        yield session
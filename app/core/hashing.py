@@ -1,9 +1,90 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional, Tuple
+import asyncio
+import time
+
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.core.config import settings
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.BCRYPT_ROUNDS
+)
+
+
+class PasswordHasher:
+    """Асинхронное хеширование паролей в отдельном ограниченном пуле потоков.
+
+    bcrypt отпускает GIL, поэтому вычисления не блокируют event loop.
+    Если в очереди уже PASSWORD_HASH_MAX_PENDING задач, новые запросы
+    сразу отклоняются с 503, а не накапливаются.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.PASSWORD_HASH_WORKERS,
+            thread_name_prefix="bcrypt"
+        )
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.errors = 0
+        self.total_time = 0.0
+
+    async def _run(self, func, *args):
+        if self.pending >= settings.PASSWORD_HASH_MAX_PENDING:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please retry later",
+                headers={"Retry-After": "1"}
+            )
+
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, partial(func, *args))
+        except Exception:
+            # Ошибки (например, битый хеш) не учитываем в среднем времени
+            self.errors += 1
+            raise
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        self.total_time += time.perf_counter() - start
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(pwd_context.verify, plain_password, hashed_password)
+
+    async def verify_and_update(
+        self,
+        plain_password: str,
+        hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        """Проверяет пароль и, если стоимость хеша устарела, возвращает новый хеш"""
+        return await self._run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "workers": settings.PASSWORD_HASH_WORKERS,
+            "max_pending": settings.PASSWORD_HASH_MAX_PENDING,
+            "bcrypt_rounds": settings.BCRYPT_ROUNDS,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "avg_time_ms": round(self.total_time / self.completed * 1000, 3) if self.completed else 0.0,
+        }
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+# Глобальный экземпляр сервиса хеширования
+password_hasher = PasswordHasher()
@@ -3,21 +3,14 @@ from jose import JWTError, jwt
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from app.core.config import settings
 from app.crud.user import get_user_by_email
+from app.services.user_cache import user_cache
 from app.database import get_db
 from app.schema.user import UserInDB
 from app.schema.token import TokenPair
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
@@ -46,8 +39,7 @@ def create_tokens(data: dict) -> TokenPair:
     )
 
 async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: AsyncSession = Depends(get_db)
+    token: str = Depends(oauth2_scheme)
 ) -> UserInDB:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -69,7 +61,7 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    user = await get_user_by_email(db, email=email)
+    user = await user_cache.get(email)
     if user is None:
         raise credentials_exception
     return user
@@ -1,47 +1,37 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
-from typing import Optional, List
+from sqlalchemy import literal, delete
+from sqlalchemy.dialects.postgresql import UUID, insert as pg_insert
+from typing import Optional, List, Dict
 import uuid
 from fastapi import HTTPException
 
 from app.models.cart import CartItem
 from app.models.product import Product
-from app.schema.cart import CartItemInDB, CartItemCreate, CartItemUpdate
+from app.schema.cart import CartItemInDB, CartItemCreate, CartItemUpdate, CartOperation
 from app.services.file_storage import file_storage
-
-async def _add_image_url_to_product(product: Product) -> Optional[dict]:
-    """Вспомогательная функция для добавления URL изображения к продукту"""
-    if not product:
-        return None
-    
-    return {
-        "id": product.id,
-        "name": product.name,
-        "description": product.description,
-        "price": product.price,
-        "stock": product.stock,
-        "is_active": product.is_active,
-        "category": product.category,
-        "image_object_name": product.image_object_name,
-        "created_at": product.created_at,
-        "updated_at": product.updated_at,
-        "image_url": file_storage.get_image_url(product.image_object_name) if product.image_object_name else None
-    }
+from app.services.cart_store import cart_store, CartContents
+from app.services.product_loader import product_loader
+from app.crud.product import serialize_product
 
 async def get_cart_items(db: AsyncSession, user_id: uuid.UUID) -> List[CartItemInDB]:
     """Получить все элементы корзины пользователя с данными о товарах"""
+    if cart_store.enabled:
+        return await _redis_get_cart_items(db, user_id)
     try:
         result = await db.execute(
-            select(CartItem)
-            .options(selectinload(CartItem.product))
-            .filter(CartItem.user_id == user_id)
+            select(CartItem).filter(CartItem.user_id == user_id)
         )
         cart_items = result.scalars().all()
+        products = await product_loader(db).load_many(item.product_id for item in cart_items)
+        image_urls = file_storage.get_image_urls(
+            product.image_object_name for product in products.values() if product
+        )
         
         result_items = []
         for item in cart_items:
-            product_data = await _add_image_url_to_product(item.product) if item.product else None
+            product = products[item.product_id]
+            product_data = serialize_product(product, image_urls)
             
             cart_item_data = {
                 "id": item.id,
@@ -58,18 +48,19 @@ async def get_cart_items(db: AsyncSession, user_id: uuid.UUID) -> List[CartItemI
 
 async def get_cart_item(db: AsyncSession, cart_item_id: uuid.UUID) -> Optional[CartItemInDB]:
     """Получить конкретный элемент корзины по ID"""
+    if cart_store.enabled:
+        return await _redis_get_cart_item(db, cart_item_id)
     try:
         result = await db.execute(
-            select(CartItem)
-            .options(selectinload(CartItem.product))
-            .filter(CartItem.id == cart_item_id)
+            select(CartItem).filter(CartItem.id == cart_item_id)
         )
         item = result.scalars().first()
         
         if not item:
             return None
         
-        product_data = await _add_image_url_to_product(item.product) if item.product else None
+        product = await product_loader(db).load(item.product_id)
+        product_data = serialize_product(product)
         
         return CartItemInDB(
             id=item.id,
@@ -82,75 +73,68 @@ async def get_cart_item(db: AsyncSession, cart_item_id: uuid.UUID) -> Optional[C
         raise HTTPException(status_code=500, detail=f"Error fetching cart item: {str(e)}")
 
 async def add_to_cart(db: AsyncSession, user_id: uuid.UUID, cart_item: CartItemCreate) -> CartItemInDB:
-    """Добавить товар в корзину или увеличить количество если уже существует"""
+    """Добавить товар в корзину или увеличить количество если уже существует.
+
+    Вставка, увеличение количества и проверка остатка выполняются одним
+    INSERT ... ON CONFLICT DO UPDATE, вложенным в CTE вместе с выборкой товара.
+    """
+    if cart_store.enabled:
+        return await _redis_add_to_cart(db, user_id, cart_item)
     try:
-        # Проверяем существование продукта
-        product_result = await db.execute(
-            select(Product).filter(Product.id == cart_item.product_id)
+        # Вставляем строку, только если товар активен и его хватает на складе
+        source = select(
+            literal(uuid.uuid4(), UUID(as_uuid=True)),
+            literal(user_id, UUID(as_uuid=True)),
+            Product.id,
+            literal(cart_item.quantity)
+        ).filter(
+            Product.id == cart_item.product_id,
+            Product.is_active == True,
+            Product.stock >= cart_item.quantity
         )
-        product = product_result.scalars().first()
-        
-        if not product:
-            raise HTTPException(status_code=404, detail="Product not found")
-        
-        if not product.is_active:
-            raise HTTPException(status_code=400, detail="Product is not active")
-        
-        if product.stock < cart_item.quantity:
-            raise HTTPException(status_code=400, detail="Not enough stock available")
-        
-        # Проверяем, есть ли уже такой товар в корзине
+        insert_stmt = pg_insert(CartItem).from_select(
+            ["id", "user_id", "product_id", "quantity"], source
+        )
+        # При повторном добавлении увеличиваем количество, если остаток позволяет
+        stock = select(Product.stock).filter(
+            Product.id == cart_item.product_id
+        ).scalar_subquery()
+        upsert = insert_stmt.on_conflict_do_update(
+            constraint="uq_cart_items_user_product",
+            set_={"quantity": CartItem.quantity + cart_item.quantity},
+            where=stock >= CartItem.quantity + cart_item.quantity
+        ).returning(
+            CartItem.id, CartItem.user_id, CartItem.product_id, CartItem.quantity
+        ).cte("upsert")
+
         result = await db.execute(
-            select(CartItem)
-            .options(selectinload(CartItem.product))
-            .filter(CartItem.user_id == user_id, CartItem.product_id == cart_item.product_id)
+            select(upsert.c.id, upsert.c.user_id, upsert.c.quantity, Product)
+            .join(Product, Product.id == upsert.c.product_id)
         )
-        existing_item = result.scalars().first()
-        
-        if existing_item:
-            # Обновляем количество существующего элемента
-            new_quantity = existing_item.quantity + cart_item.quantity
-            
-            if product.stock < new_quantity:
-                raise HTTPException(status_code=400, detail="Not enough stock available")
-            
-            existing_item.quantity = new_quantity
-            await db.commit()
-            await db.refresh(existing_item)
-            
-            # Загружаем обновленные данные продукта
-            await db.refresh(existing_item, ['product'])
-            product_data = await _add_image_url_to_product(existing_item.product)
-            
-            return CartItemInDB(
-                id=existing_item.id,
-                user_id=existing_item.user_id,
-                product_id=existing_item.product_id,
-                quantity=existing_item.quantity,
-                product=product_data
-            )
-        else:
-            # Создаем новый элемент корзины
-            db_item = CartItem(
-                user_id=user_id,
-                product_id=cart_item.product_id,
-                quantity=cart_item.quantity
-            )
-            db.add(db_item)
-            await db.commit()
-            await db.refresh(db_item)
-            
-            # Загружаем данные продукта
-            await db.refresh(db_item, ['product'])
-            product_data = await _add_image_url_to_product(db_item.product)
-            
-            return CartItemInDB(
-                id=db_item.id,
-                user_id=db_item.user_id,
-                product_id=db_item.product_id,
-                quantity=db_item.quantity,
-                product=product_data
+        row = result.first()
+        await db.commit()
+
+        if row is None:
+            # Строка не вставлена и не обновлена - выясняем причину
+            product_result = await db.execute(
+                select(Product.is_active).filter(Product.id == cart_item.product_id)
             )
+            is_active = product_result.scalar_one_or_none()
+            if is_active is None:
+                raise HTTPException(status_code=404, detail="Product not found")
+            if not is_active:
+                raise HTTPException(status_code=400, detail="Product is not active")
+            raise HTTPException(status_code=400, detail="Not enough stock available")
+
+        item_id, item_user_id, quantity, product = row
+        product_loader(db).prime(product)
+        return CartItemInDB(
+            id=item_id,
+            user_id=item_user_id,
+            product_id=product.id,
+            quantity=quantity,
+            product=serialize_product(product)
+        )
             
     except HTTPException:
         raise
@@ -160,20 +144,21 @@ async def add_to_cart(db: AsyncSession, user_id: uuid.UUID, cart_item: CartItemC
 
 async def update_cart_item(db: AsyncSession, cart_item_id: uuid.UUID, cart_item: CartItemUpdate) -> Optional[CartItemInDB]:
     """Обновить количество товара в корзине"""
+    if cart_store.enabled:
+        return await _redis_update_cart_item(db, cart_item_id, cart_item)
     try:
         result = await db.execute(
-            select(CartItem)
-            .options(selectinload(CartItem.product))
-            .filter(CartItem.id == cart_item_id)
+            select(CartItem).filter(CartItem.id == cart_item_id)
         )
         db_item = result.scalars().first()
         
         if not db_item:
             return None
+        product = await product_loader(db).load(db_item.product_id)
         
         # Проверяем доступное количество на складе
-        if db_item.product and cart_item.quantity is not None:
-            if db_item.product.stock < cart_item.quantity:
+        if product and cart_item.quantity is not None:
+            if product.stock < cart_item.quantity:
                 raise HTTPException(status_code=400, detail="Not enough stock available")
             
             if cart_item.quantity <= 0:
@@ -185,11 +170,7 @@ async def update_cart_item(db: AsyncSession, cart_item_id: uuid.UUID, cart_item:
             setattr(db_item, field, value)
         
         await db.commit()
-        await db.refresh(db_item)
-        
-        # Загружаем обновленные данные продукта
-        await db.refresh(db_item, ['product'])
-        product_data = await _add_image_url_to_product(db_item.product)
+        product_data = serialize_product(product)
         
         return CartItemInDB(
             id=db_item.id,
@@ -207,6 +188,8 @@ async def update_cart_item(db: AsyncSession, cart_item_id: uuid.UUID, cart_item:
 
 async def remove_from_cart(db: AsyncSession, cart_item_id: uuid.UUID) -> bool:
     """Удалить товар из корзины"""
+    if cart_store.enabled:
+        return await _redis_remove_from_cart(db, cart_item_id)
     try:
         result = await db.execute(
             select(CartItem).filter(CartItem.id == cart_item_id)
@@ -226,15 +209,10 @@ async def remove_from_cart(db: AsyncSession, cart_item_id: uuid.UUID) -> bool:
 
 async def clear_cart(db: AsyncSession, user_id: uuid.UUID) -> bool:
     """Очистить всю корзину пользователя"""
+    if cart_store.enabled:
+        return await _redis_clear_cart(user_id)
     try:
-        result = await db.execute(
-            select(CartItem).filter(CartItem.user_id == user_id)
-        )
-        cart_items = result.scalars().all()
-        
-        for item in cart_items:
-            await db.delete(item)
-        
+        await db.execute(delete(CartItem).filter(CartItem.user_id == user_id))
         await db.commit()
         return True
         
@@ -242,8 +220,102 @@ async def clear_cart(db: AsyncSession, user_id: uuid.UUID) -> bool:
         await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error clearing cart: {str(e)}")
 
+async def _load_operation_products(db: AsyncSession, operations: List[CartOperation]) -> dict:
+    """Остатки и активность товаров, затронутых операциями add/update"""
+    products = await product_loader(db).load_many(
+        op.product_id for op in operations if op.op != "remove"
+    )
+    return {product_id: product for product_id, product in products.items() if product}
+
+def _resolve_cart_operations(
+    quantities: Dict[uuid.UUID, int],
+    products: dict,
+    operations: List[CartOperation]
+) -> Dict[uuid.UUID, int]:
+    """Применяет операции к количествам в памяти с проверкой товаров и остатков"""
+    quantities = dict(quantities)
+    for index, operation in enumerate(operations):
+        if operation.op == "remove":
+            quantities[operation.product_id] = 0
+            continue
+
+        product = products.get(operation.product_id)
+        if product is None:
+            raise HTTPException(status_code=404, detail=f"Operation {index}: Product not found")
+        if not product.is_active:
+            raise HTTPException(status_code=400, detail=f"Operation {index}: Product is not active")
+
+        if operation.op == "add":
+            quantity = quantities.get(operation.product_id, 0) + operation.quantity
+        else:
+            quantity = operation.quantity
+
+        if product.stock < quantity:
+            raise HTTPException(status_code=400, detail=f"Operation {index}: Not enough stock available")
+        quantities[operation.product_id] = quantity
+    return quantities
+
+async def apply_cart_operations(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    operations: List[CartOperation]
+) -> List[CartItemInDB]:
+    """Применить пакет операций к корзине в одной транзакции.
+
+    Итоговые количества вычисляются в памяти, затем записываются одним
+    DELETE и одним INSERT ... ON CONFLICT DO UPDATE.
+    """
+    if cart_store.enabled:
+        return await _redis_apply_cart_operations(db, user_id, operations)
+    try:
+        # Текущее содержимое корзины (строки блокируются до конца транзакции)
+        cart_result = await db.execute(
+            select(CartItem.product_id, CartItem.quantity)
+            .filter(CartItem.user_id == user_id)
+            .with_for_update()
+        )
+        quantities = dict(cart_result.all())
+
+        products = await _load_operation_products(db, operations)
+        quantities = _resolve_cart_operations(quantities, products, operations)
+
+        touched = {op.product_id for op in operations}
+        removed = [pid for pid in touched if quantities[pid] == 0]
+        kept = [
+            {"id": uuid.uuid4(), "user_id": user_id, "product_id": pid, "quantity": quantities[pid]}
+            for pid in touched if quantities[pid] > 0
+        ]
+
+        if removed:
+            await db.execute(
+                delete(CartItem).filter(
+                    CartItem.user_id == user_id,
+                    CartItem.product_id.in_(removed)
+                )
+            )
+        if kept:
+            insert_stmt = pg_insert(CartItem).values(kept)
+            await db.execute(
+                insert_stmt.on_conflict_do_update(
+                    constraint="uq_cart_items_user_product",
+                    set_={"quantity": insert_stmt.excluded.quantity}
+                )
+            )
+        await db.commit()
+
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error updating cart: {str(e)}")
+
+    return await get_cart_items(db, user_id)
+
 async def get_cart_items_count(db: AsyncSession, user_id: uuid.UUID) -> int:
     """Получить общее количество товаров в корзине"""
+    if cart_store.enabled:
+        return await _redis_get_cart_items_count(db, user_id)
     try:
         from sqlalchemy import func
         
@@ -255,4 +327,172 @@ async def get_cart_items_count(db: AsyncSession, user_id: uuid.UUID) -> int:
         return count
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error getting cart count: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error getting cart count: {str(e)}")
+
+# Реализация поверх Redis (settings.CART_STORE == "redis"): корзина читается
+# и меняется в Redis, в cart_items ее пачками сохраняет cart_store.flush()
+
+async def _redis_cart_items(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    contents: CartContents
+) -> List[CartItemInDB]:
+    """Собирает элементы корзины с данными товаров одним запросом к products"""
+    if not contents:
+        return []
+    products = await product_loader(db).load_many(contents)
+    image_urls = file_storage.get_image_urls(p.image_object_name for p in products.values() if p)
+
+    items = []
+    for product_id, (item_id, quantity) in contents.items():
+        product = products.get(product_id)
+        items.append(CartItemInDB(
+            id=item_id,
+            user_id=user_id,
+            product_id=product_id,
+            quantity=quantity,
+            product=serialize_product(product, image_urls)
+        ))
+    return items
+
+async def _redis_find_item(db: AsyncSession, cart_item_id: uuid.UUID) -> Optional[tuple]:
+    """(user_id, product_id) элемента корзины: из индекса в Redis или из Postgres"""
+    found = await cart_store.find_item(cart_item_id)
+    if found:
+        return found
+    result = await db.execute(
+        select(CartItem.user_id, CartItem.product_id).filter(CartItem.id == cart_item_id)
+    )
+    row = result.first()
+    return (row.user_id, row.product_id) if row else None
+
+async def _redis_get_cart_items(db: AsyncSession, user_id: uuid.UUID) -> List[CartItemInDB]:
+    try:
+        contents = await cart_store.ensure_loaded(db, user_id)
+        return await _redis_cart_items(db, user_id, contents)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching cart items: {str(e)}")
+
+async def _redis_get_cart_item(db: AsyncSession, cart_item_id: uuid.UUID) -> Optional[CartItemInDB]:
+    try:
+        found = await _redis_find_item(db, cart_item_id)
+        if not found:
+            return None
+        user_id, product_id = found
+        contents = await cart_store.ensure_loaded(db, user_id)
+        if product_id not in contents or contents[product_id][0] != cart_item_id:
+            return None
+        items = await _redis_cart_items(db, user_id, {product_id: contents[product_id]})
+        return items[0]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching cart item: {str(e)}")
+
+async def _redis_add_to_cart(db: AsyncSession, user_id: uuid.UUID, cart_item: CartItemCreate) -> CartItemInDB:
+    try:
+        product = await product_loader(db).load(cart_item.product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        if not product.is_active:
+            raise HTTPException(status_code=400, detail="Product is not active")
+
+        await cart_store.ensure_loaded(db, user_id)
+        # Остаток проверяется в том же скрипте, что и увеличивает количество
+        added = await cart_store.increment(db, user_id, product.id, cart_item.quantity, product.stock)
+        if added is None:
+            raise HTTPException(status_code=400, detail="Not enough stock available")
+        item_id, quantity = added
+
+        return CartItemInDB(
+            id=item_id,
+            user_id=user_id,
+            product_id=product.id,
+            quantity=quantity,
+            product=serialize_product(product)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error adding to cart: {str(e)}")
+
+async def _redis_update_cart_item(
+    db: AsyncSession,
+    cart_item_id: uuid.UUID,
+    cart_item: CartItemUpdate
+) -> Optional[CartItemInDB]:
+    try:
+        found = await _redis_find_item(db, cart_item_id)
+        if not found:
+            return None
+        user_id, product_id = found
+        contents = await cart_store.ensure_loaded(db, user_id)
+        if product_id not in contents:
+            return None
+        if cart_item.quantity is None:
+            return await _redis_get_cart_item(db, cart_item_id)
+
+        product = await product_loader(db).load(product_id)
+        if product and product.stock < cart_item.quantity:
+            raise HTTPException(status_code=400, detail="Not enough stock available")
+
+        contents = await cart_store.set_quantities(db, user_id, {product_id: cart_item.quantity})
+        item_id, quantity = contents[product_id]
+        return CartItemInDB(
+            id=item_id,
+            user_id=user_id,
+            product_id=product_id,
+            quantity=quantity,
+            product=serialize_product(product)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating cart item: {str(e)}")
+
+async def _redis_remove_from_cart(db: AsyncSession, cart_item_id: uuid.UUID) -> bool:
+    try:
+        found = await _redis_find_item(db, cart_item_id)
+        if not found:
+            return False
+        user_id, product_id = found
+        contents = await cart_store.ensure_loaded(db, user_id)
+        if product_id not in contents:
+            return False
+        await cart_store.set_quantities(db, user_id, {product_id: 0})
+        return True
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error removing from cart: {str(e)}")
+
+async def _redis_clear_cart(user_id: uuid.UUID) -> bool:
+    try:
+        await cart_store.clear(user_id)
+        return True
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error clearing cart: {str(e)}")
+
+async def _redis_apply_cart_operations(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    operations: List[CartOperation]
+) -> List[CartItemInDB]:
+    try:
+        contents = await cart_store.ensure_loaded(db, user_id)
+        quantities = {pid: quantity for pid, (_, quantity) in contents.items()}
+        products = await _load_operation_products(db, operations)
+        quantities = _resolve_cart_operations(quantities, products, operations)
+
+        touched = {op.product_id for op in operations}
+        contents = await cart_store.set_quantities(
+            db, user_id, {pid: quantities[pid] for pid in touched}
+        )
+        return await _redis_cart_items(db, user_id, contents)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating cart: {str(e)}")
+
+async def _redis_get_cart_items_count(db: AsyncSession, user_id: uuid.UUID) -> int:
+    try:
+        contents = await cart_store.ensure_loaded(db, user_id)
+        return sum(quantity for _, quantity in contents.values())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting cart count: {str(e)}")
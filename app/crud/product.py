@@ -1,62 +1,62 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import update, delete, func
-from typing import Optional, List
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID
+from sqlalchemy import update, delete, func, tuple_, cast, not_, Numeric
+from typing import AsyncIterator, Optional, List, Dict, Sequence
 import uuid
 from fastapi import HTTPException, UploadFile
 from datetime import datetime
 
 from app.models.product import Product
-from app.schema.product import ProductInDB, ProductCreate, ProductUpdate
+from app.models.cart import CartItem
+from app.schema.product import (
+    ProductInDB, ProductCreate, ProductUpdate, ProductPage,
+    ProductSelector, ProductBulkUpdate, ProductBulkResult
+)
+from app.core.config import settings
+from app.database import async_session, set_change_source
 from app.services.file_storage import file_storage
+from app.services.autocomplete import autocomplete_index
+from app.services.product_cache import product_cache, CHANGE_SOURCE
+from app.services.product_loader import product_loader
+from app.crud.search import search_clause, after_cursor
+from app.crud.stats import record_product_change, record_product_changes, stats_snapshot
+from app.utils.serialization import type_adapter
+from app.utils.pagination import encode_cursor, decode_cursor, encode_rank_cursor, decode_rank_cursor
+
+# Стабильный порядок выдачи: новые товары первыми, id разрешает совпадения created_at
+PRODUCT_ORDER = (Product.created_at.desc(), Product.id.desc())
 
 async def get_product(db: AsyncSession, product_id: uuid.UUID) -> Optional[ProductInDB]:
     """Получить товар по ID"""
-    result = await db.execute(select(Product).filter(Product.id == product_id))
-    product = result.scalars().first()
-    if product:
-        return await _add_image_url_to_product(product)
-    return None
+    return serialize_product(await product_loader(db).load(product_id))
+
+async def get_products_by_ids(db: AsyncSession, product_ids: List[uuid.UUID]) -> Dict[uuid.UUID, ProductInDB]:
+    """Получить товары по списку ID одним запросом (отсутствующих в результате нет)"""
+    products = [p for p in (await product_loader(db).load_many(product_ids)).values() if p]
+    return {item.id: item for item in serialize_products(products)}
 
 async def get_products(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[ProductInDB]:
     """Получить список товаров"""
-    result = await db.execute(select(Product).offset(skip).limit(limit))
-    products = result.scalars().all()
-    
-    result_products = []
-    for product in products:
-        try:
-            product_with_image = await _add_image_url_to_product(product)
-            result_products.append(product_with_image)
-        except Exception as e:
-            print(f"Error processing product {product.id}: {e}")
-            result_products.append(ProductInDB(
-                id=product.id,
-                name=product.name,
-                description=product.description,
-                price=product.price,
-                stock=product.stock,
-                is_active=product.is_active,
-                category=product.category,
-                sku=product.sku,
-                weight=product.weight,
-                dimensions=product.dimensions,
-                image_object_name=product.image_object_name,
-                created_at=product.created_at,
-                updated_at=product.updated_at,
-                image_url=None
-            ))
-    
-    return result_products
+    result = await db.execute(
+        select(Product).order_by(*PRODUCT_ORDER).offset(skip).limit(limit)
+    )
+    return serialize_products(result.scalars().all())
 
 async def create_product(db: AsyncSession, product: ProductCreate) -> ProductInDB:
     """Создать новый товар (без изображения)"""
+    await set_change_source(db, CHANGE_SOURCE)
     product_data = product.dict(exclude={"image_url"})
     db_product = Product(**product_data)
     db.add(db_product)
+    # Значения по умолчанию (is_active, stock) появляются только после flush
+    await db.flush()
+    await record_product_change(db, None, stats_snapshot(db_product))
     await db.commit()
     await db.refresh(db_product)
-    return await _add_image_url_to_product(db_product)
+    autocomplete_index.upsert(db_product)
+    await product_cache.invalidate(db_product.id, [db_product.category])
+    return serialize_product(db_product)
 
 async def create_product_with_image(
     db: AsyncSession, 
@@ -64,9 +64,13 @@ async def create_product_with_image(
     image_file: Optional[UploadFile] = None
 ) -> ProductInDB:
     """Создать товар с изображением"""
+    await set_change_source(db, CHANGE_SOURCE)
     product_data = product.dict(exclude={"image_url"})
     db_product = Product(**product_data)
     db.add(db_product)
+    # Значения по умолчанию (is_active, stock) появляются только после flush
+    await db.flush()
+    await record_product_change(db, None, stats_snapshot(db_product))
     await db.commit()
     await db.refresh(db_product)
     
@@ -79,10 +83,13 @@ async def create_product_with_image(
             await db.refresh(db_product)
         except Exception as e:
             await db.delete(db_product)
+            await record_product_change(db, stats_snapshot(db_product), None)
             await db.commit()
             raise e
     
-    return await _add_image_url_to_product(db_product)
+    autocomplete_index.upsert(db_product)
+    await product_cache.invalidate(db_product.id, [db_product.category])
+    return serialize_product(db_product)
 
 async def update_product(
     db: AsyncSession, 
@@ -90,12 +97,15 @@ async def update_product(
     product_update: ProductUpdate
 ) -> Optional[ProductInDB]:
     """Обновить данные товара"""
+    await set_change_source(db, CHANGE_SOURCE)
     result = await db.execute(select(Product).filter(Product.id == product_id))
     db_product = result.scalars().first()
     
     if not db_product:
         return None
     
+    old_category = db_product.category
+    before = stats_snapshot(db_product)
     update_data = product_update.dict(exclude_unset=True, exclude={"image_url"})
     
     # Фильтруем None значения для обязательных полей
@@ -104,13 +114,17 @@ async def update_product(
             setattr(db_product, field, value)
     
     db_product.updated_at = datetime.utcnow()
+    await record_product_change(db, before, stats_snapshot(db_product))
     
     await db.commit()
     await db.refresh(db_product)
-    return await _add_image_url_to_product(db_product)
+    autocomplete_index.upsert(db_product)
+    await product_cache.invalidate(product_id, [old_category, db_product.category])
+    return serialize_product(db_product)
 
 async def delete_product(db: AsyncSession, product_id: uuid.UUID) -> bool:
     """Удалить товар"""
+    await set_change_source(db, CHANGE_SOURCE)
     result = await db.execute(select(Product).filter(Product.id == product_id))
     db_product = result.scalars().first()
     
@@ -123,23 +137,33 @@ async def delete_product(db: AsyncSession, product_id: uuid.UUID) -> bool:
         except Exception as e:
             print(f"Error deleting image from MinIO: {e}")
     
+    category = db_product.category
     await db.delete(db_product)
+    await record_product_change(db, stats_snapshot(db_product), None)
     await db.commit()
+    autocomplete_index.remove(product_id)
+    product_loader(db).clear([product_id])
+    await product_cache.invalidate(product_id, [category])
     return True
 
 async def toggle_product_activity(db: AsyncSession, product_id: uuid.UUID) -> Optional[ProductInDB]:
     """Переключить активность товара"""
+    await set_change_source(db, CHANGE_SOURCE)
     result = await db.execute(select(Product).filter(Product.id == product_id))
     db_product = result.scalars().first()
     
     if not db_product:
         return None
     
+    before = stats_snapshot(db_product)
     db_product.is_active = not db_product.is_active
     db_product.updated_at = datetime.utcnow()
+    await record_product_change(db, before, stats_snapshot(db_product))
     await db.commit()
     await db.refresh(db_product)
-    return await _add_image_url_to_product(db_product)
+    autocomplete_index.upsert(db_product)
+    await product_cache.invalidate(product_id, [db_product.category])
+    return serialize_product(db_product)
 
 async def update_product_image(
     db: AsyncSession, 
@@ -147,6 +171,7 @@ async def update_product_image(
     image_file: UploadFile
 ) -> Optional[ProductInDB]:
     """Обновить изображение товара"""
+    await set_change_source(db, CHANGE_SOURCE)
     result = await db.execute(select(Product).filter(Product.id == product_id))
     db_product = result.scalars().first()
     
@@ -166,11 +191,121 @@ async def update_product_image(
         db_product.updated_at = datetime.utcnow()
         await db.commit()
         await db.refresh(db_product)
-        return await _add_image_url_to_product(db_product)
+        await product_cache.invalidate(product_id, [db_product.category])
+        return serialize_product(db_product)
     except Exception as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error updating image: {str(e)}")
 
+def _selector_conditions(table, selector: ProductSelector) -> list:
+    """Условия WHERE для массовой операции"""
+    conditions = []
+    if selector.ids is not None:
+        conditions.append(table.c.id == func.any(cast(selector.ids, ARRAY(PG_UUID(as_uuid=True)))))
+    if selector.category is not None:
+        conditions.append(table.c.category == selector.category)
+    if selector.is_active is not None:
+        conditions.append(table.c.is_active == selector.is_active)
+    return conditions
+
+async def bulk_update_products(db: AsyncSession, bulk: ProductBulkUpdate) -> ProductBulkResult:
+    """Массовое изменение товаров одним UPDATE ... RETURNING"""
+    await set_change_source(db, CHANGE_SOURCE)
+    values = bulk.set.model_dump(exclude_unset=True, exclude_none=True) if bulk.set else {}
+    if bulk.price_percent is not None:
+        values["price"] = func.round(cast(Product.price * (1 + bulk.price_percent / 100), Numeric), 2)
+    if bulk.toggle_active:
+        values["is_active"] = not_(func.coalesce(Product.is_active, False))
+    values["updated_at"] = func.now()
+
+    # Самосоединение дает значения до изменения (для счетчиков и сброса кэша)
+    old = Product.__table__.alias("old")
+    result = await db.execute(
+        update(Product)
+        .where(Product.id == old.c.id, *_selector_conditions(old, bulk.where))
+        .values(**values)
+        .returning(
+            Product.id, Product.name, Product.sku, Product.category, Product.is_active, Product.stock,
+            old.c.category.label("old_category"),
+            old.c.is_active.label("old_is_active"),
+            old.c.stock.label("old_stock"),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+    await record_product_changes(db, [
+        ((row.old_category, row.old_is_active is True, row.old_stock or 0), stats_snapshot(row))
+        for row in rows
+    ])
+    await db.commit()
+
+    for row in rows:
+        autocomplete_index.upsert(row)
+    # Изменения сделаны в обход сессии - загруженные объекты устарели
+    product_loader(db).clear(row.id for row in rows)
+    if rows:
+        await product_cache.invalidate_many(
+            [row.id for row in rows],
+            {row.category for row in rows} | {row.old_category for row in rows}
+        )
+    return ProductBulkResult(affected=len(rows), ids=[row.id for row in rows])
+
+async def bulk_delete_products(db: AsyncSession, selector: ProductSelector) -> ProductBulkResult:
+    """Массовое удаление товаров одним DELETE ... RETURNING.
+
+    Строки корзин с этими товарами удаляются тем же запросом (внешний ключ
+    cart_items.product_id не каскадный), изображения - одним запросом к MinIO.
+    """
+    await set_change_source(db, CHANGE_SOURCE)
+    products = Product.__table__
+    removed = (
+        delete(products)
+        .where(*_selector_conditions(products, selector))
+        .returning(
+            products.c.id, products.c.category, products.c.is_active,
+            products.c.stock, products.c.image_object_name
+        )
+        .cte("removed")
+    )
+    removed_cart_items = (
+        delete(CartItem.__table__)
+        .where(CartItem.__table__.c.product_id.in_(select(removed.c.id)))
+        .cte("removed_cart_items")
+    )
+    result = await db.execute(select(removed).add_cte(removed_cart_items))
+    rows = result.all()
+    await record_product_changes(db, [(stats_snapshot(row), None) for row in rows])
+    await db.commit()
+
+    for row in rows:
+        autocomplete_index.remove(row.id)
+    product_loader(db).clear(row.id for row in rows)
+    if rows:
+        await product_cache.invalidate_many([row.id for row in rows], {row.category for row in rows})
+        await file_storage.delete_images(row.image_object_name for row in rows)
+    return ProductBulkResult(affected=len(rows), ids=[row.id for row in rows])
+
+async def stream_products(
+    include_inactive: bool = False,
+    skip: int = 0,
+    limit: Optional[int] = None
+) -> AsyncIterator[List[ProductInDB]]:
+    """Товары пачками из серверного курсора (для потоковых админских списков).
+
+    Открывает собственную сессию: StreamingResponse читает генератор уже
+    после выхода из зависимостей запроса.
+    """
+    query = select(Product).order_by(*PRODUCT_ORDER).offset(skip).limit(limit)
+    if not include_inactive:
+        query = query.filter(Product.is_active == True)
+
+    async with async_session() as session:
+        result = await session.stream_scalars(
+            query.execution_options(yield_per=settings.LISTING_STREAM_BATCH_SIZE)
+        )
+        async for products in result.partitions():
+            yield serialize_products(products)
+
 async def get_products_by_category(
     db: AsyncSession, 
     category: str, 
@@ -181,11 +316,11 @@ async def get_products_by_category(
     result = await db.execute(
         select(Product)
         .filter(Product.category == category, Product.is_active == True)
+        .order_by(*PRODUCT_ORDER)
         .offset(skip)
         .limit(limit)
     )
-    products = result.scalars().all()
-    return [await _add_image_url_to_product(product) for product in products]
+    return serialize_products(result.scalars().all())
 
 async def search_products(
     db: AsyncSession, 
@@ -193,36 +328,107 @@ async def search_products(
     skip: int = 0, 
     limit: int = 100
 ) -> List[ProductInDB]:
-    """Поиск товаров по названию и описанию"""
+    """Поиск товаров по названию и описанию (с ранжированием по релевантности)"""
+    condition, score = search_clause(query)
     result = await db.execute(
         select(Product)
-        .filter(
-            (Product.name.ilike(f"%{query}%")) | 
-            (Product.description.ilike(f"%{query}%")),
-            Product.is_active == True
-        )
+        .filter(condition, Product.is_active == True)
+        .order_by(score.desc(), Product.id.desc())
         .offset(skip)
         .limit(limit)
     )
+    return serialize_products(result.scalars().all())
+
+async def search_products_page(
+    db: AsyncSession,
+    query: str,
+    cursor: Optional[str] = None,
+    limit: int = 100
+) -> ProductPage:
+    """Поиск товаров с курсорной пагинацией по (релевантность, id)"""
+    condition, score = search_clause(query)
+    stmt = select(Product, score.label("score")).filter(condition, Product.is_active == True)
+    if cursor:
+        stmt = stmt.filter(after_cursor(score, decode_rank_cursor(cursor)))
+
+    result = await db.execute(stmt.order_by(score.desc(), Product.id.desc()).limit(limit + 1))
+    rows = result.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_product, last_score = rows[-1]
+        next_cursor = encode_rank_cursor(last_score, last_product.id)
+
+    return ProductPage(
+        items=serialize_products([product for product, _ in rows]),
+        next_cursor=next_cursor
+    )
+
+async def get_products_page(
+    db: AsyncSession,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    category: Optional[str] = None,
+    search: Optional[str] = None,
+    active_only: bool = False
+) -> ProductPage:
+    """Получить страницу товаров по курсору (keyset-пагинация по created_at, id)"""
+    if search and not category:
+        return await search_products_page(db, search, cursor, limit)
+
+    query = select(Product)
+    if category:
+        query = query.filter(Product.category == category)
+        active_only = True
+    if active_only:
+        query = query.filter(Product.is_active == True)
+
+    if cursor:
+        created_at, product_id = decode_cursor(cursor)
+        query = query.filter(
+            tuple_(Product.created_at, Product.id) < tuple_(created_at, product_id)
+        )
+
+    # Берем на одну запись больше, чтобы понять, есть ли следующая страница
+    result = await db.execute(query.order_by(*PRODUCT_ORDER).limit(limit + 1))
     products = result.scalars().all()
-    return [await _add_image_url_to_product(product) for product in products]
-
-async def _add_image_url_to_product(product: Product) -> ProductInDB:
-    """Добавить URL изображения к данным продукта"""
-    product_dict = {
-        "id": product.id,
-        "name": product.name,
-        "description": product.description,
-        "price": product.price,
-        "stock": product.stock,
-        "is_active": product.is_active,
-        "category": product.category,
-        "sku": product.sku,
-        "weight": product.weight,
-        "dimensions": product.dimensions,
-        "image_object_name": product.image_object_name,
-        "created_at": product.created_at,
-        "updated_at": product.updated_at,
-        "image_url": file_storage.get_image_url(product.image_object_name) if product.image_object_name else None
-    }
-    return ProductInDB(**product_dict)
\ No newline at end of file
+
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        next_cursor = encode_cursor(products[-1].created_at, products[-1].id)
+
+    return ProductPage(
+        items=serialize_products(products),
+        next_cursor=next_cursor
+    )
+
+def serialize_products(
+    products: Sequence[Product],
+    image_urls: Optional[Dict[str, Optional[str]]] = None
+) -> List[ProductInDB]:
+    """ORM-товары -> ProductInDB одной валидацией списка, с URL изображений.
+
+    Единственное место, где товар превращается в схему ответа: crud и
+    эндпоинты товаров и корзины используют только эти функции.
+    """
+    if image_urls is None:
+        image_urls = file_storage.get_image_urls(p.image_object_name for p in products)
+    items = type_adapter(List[ProductInDB]).validate_python(products, from_attributes=True)
+    for item in items:
+        if item.image_object_name:
+            item.image_url = image_urls.get(item.image_object_name)
+    return items
+
+def serialize_product(
+    product: Optional[Product],
+    image_urls: Optional[Dict[str, Optional[str]]] = None
+) -> Optional[ProductInDB]:
+    """Один ORM-товар -> ProductInDB (None для отсутствующего товара)"""
+    if product is None:
+        return None
+    item = ProductInDB.model_validate(product, from_attributes=True)
+    if item.image_object_name:
+        item.image_url = (image_urls or {}).get(item.image_object_name) or file_storage.get_image_url(item.image_object_name)
+    return item
@@ -0,0 +1,243 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, literal_column, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import SQLAlchemyError
+from pydantic import ValidationError
+from typing import AsyncIterator, Dict, FrozenSet, List, Optional, Set, Tuple
+import csv
+import io
+import uuid
+
+import orjson
+
+from app.core.config import settings
+from app.database import async_session, set_change_source
+from app.models.product import Product
+from app.schema.product import ProductImportRow, ProductImportReport, ImportRowError
+from app.services.autocomplete import autocomplete_index
+from app.services.product_cache import product_cache, CHANGE_SOURCE
+from app.crud.product import PRODUCT_ORDER
+from app.crud.stats import reconcile_counters
+from app.utils.record_stream import Record
+
+# Колонки, которые импорт записывает в products
+IMPORT_FIELDS = (
+    "name", "description", "price", "stock", "category", "sku",
+    "weight", "dimensions", "image_object_name", "is_active",
+)
+
+# Колонки, которые импорт может менять у существующего товара. Картинку
+# импорт не трогает: иначе файл без этой колонки отвязал бы ее от товара
+UPDATE_FIELDS = frozenset(IMPORT_FIELDS) - {"image_object_name"}
+
+# Колонки экспорта (файл экспорта можно снова загрузить импортом)
+EXPORT_FIELDS = (
+    "id", "sku", "name", "description", "price", "stock", "category",
+    "weight", "dimensions", "is_active", "image_object_name",
+    "created_at", "updated_at",
+)
+
+# Строка для записи: (номер строки во входном файле, значения колонок,
+# колонки, заданные в строке явно - только они меняются у существующего товара)
+ImportRow = Tuple[int, Dict[str, object], FrozenSet[str]]
+
+
+class _ImportState:
+    """Отчет об импорте"""
+
+    def __init__(self):
+        self.report = ProductImportReport()
+
+    def error(self, row: int, message: str) -> None:
+        self.report.failed += 1
+        if len(self.report.errors) < settings.PRODUCT_IMPORT_MAX_ERRORS:
+            self.report.errors.append(ImportRowError(row=row, error=message))
+        else:
+            self.report.errors_truncated = True
+
+
+def _format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors()
+    )
+
+
+def _upsert_statement(rows: List[Dict[str, object]], key: str, fields: FrozenSet[str]):
+    """INSERT ... ON CONFLICT по key ("id" - строки экспорта, "sku" - остальные).
+
+    У существующих товаров обновляются только колонки fields.
+    """
+    stmt = pg_insert(Product).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[key],
+        set_={
+            **{field: stmt.excluded[field] for field in IMPORT_FIELDS if field in fields and field != key},
+            "updated_at": func.now(),
+        }
+    ).returning(
+        Product.id, Product.name, Product.sku, Product.category, Product.is_active,
+        # xmax = 0 только у только что вставленных строк
+        literal_column("xmax = 0").label("inserted"),
+    )
+
+
+async def _write_batch(db: AsyncSession, batch: List[ImportRow], state: _ImportState) -> None:
+    # Повтор ключа в одном INSERT ... ON CONFLICT недопустим - побеждает
+    # последняя строка, вытесненная попадает в отчет как ошибка
+    by_id: Dict[uuid.UUID, ImportRow] = {}
+    by_sku: Dict[str, ImportRow] = {}
+    rows: List[ImportRow] = []
+    for row_no, values, fields in batch:
+        if values["id"] is not None:
+            superseded = by_id.get(values["id"])
+            by_id[values["id"]] = (row_no, values, fields)
+        elif values["sku"]:
+            superseded = by_sku.get(values["sku"])
+            by_sku[values["sku"]] = (row_no, values, fields)
+        else:
+            superseded = None
+            rows.append((row_no, {**values, "id": uuid.uuid4()}, fields))
+        if superseded is not None:
+            state.error(superseded[0], f"duplicate id/sku in batch, superseded by row {row_no}")
+    rows.extend((row_no, {**values, "id": uuid.uuid4()}, fields) for row_no, values, fields in by_sku.values())
+
+    # Один INSERT на каждый ключ и набор заданных колонок
+    groups: Dict[Tuple[str, FrozenSet[str]], List[ImportRow]] = {}
+    for key, key_rows in (("id", by_id.values()), ("sku", rows)):
+        for row in key_rows:
+            groups.setdefault((key, row[2]), []).append(row)
+
+    # Старые категории обновляемых товаров: их списки тоже нужно сбросить
+    categories: Set[str] = set()
+    if by_id or by_sku:
+        result = await db.execute(
+            select(Product.category)
+            .filter(or_(Product.id.in_(list(by_id)), Product.sku.in_(list(by_sku))))
+            .distinct()
+        )
+        categories.update(result.scalars().all())
+
+    returned = []
+    try:
+        async with db.begin_nested():
+            for (key, fields), group in groups.items():
+                result = await db.execute(_upsert_statement([values for _, values, _ in group], key, fields))
+                returned.extend(result.all())
+    except SQLAlchemyError:
+        # Пачка не прошла - повторяем построчно, чтобы найти виноватые строки
+        returned = []
+        for (key, fields), group in groups.items():
+            for row_no, values, _ in group:
+                try:
+                    async with db.begin_nested():
+                        result = await db.execute(_upsert_statement([values], key, fields))
+                        returned.extend(result.all())
+                except SQLAlchemyError as e:
+                    state.error(row_no, str(getattr(e, "orig", None) or e))
+    await db.commit()
+
+    updated_ids = set()
+    for row in returned:
+        if row.inserted:
+            state.report.created += 1
+        else:
+            state.report.updated += 1
+            updated_ids.add(row.id)
+        categories.add(row.category)
+        autocomplete_index.upsert(row)
+    # Сбрасываем кэш сразу после фиксации пачки, а не в конце долгого импорта
+    if returned:
+        await product_cache.invalidate_many(updated_ids, categories)
+
+
+async def import_products(
+    db: AsyncSession,
+    records: AsyncIterator[Record],
+    batch_size: Optional[int] = None
+) -> ProductImportReport:
+    """Импортирует товары из потока записей пачками INSERT ... ON CONFLICT.
+
+    Строки с id (например, из файла экспорта) обновляют товар с этим id,
+    остальные - товар с тем же sku. У существующего товара меняются только
+    колонки, заданные в строке (кроме картинки). Каждая пачка фиксируется отдельно;
+    ошибки разбора, проверки и записи попадают в отчет с номером строки
+    и не прерывают импорт.
+    """
+    await set_change_source(db, CHANGE_SOURCE)
+    batch_size = batch_size or settings.PRODUCT_IMPORT_BATCH_SIZE
+    state = _ImportState()
+    batch: List[ImportRow] = []
+
+    try:
+        async for row_no, data in records:
+            state.report.processed += 1
+            if isinstance(data, str):
+                state.error(row_no, data)
+                continue
+            # Пустые ячейки CSV - отсутствующие значения
+            data = {key: value for key, value in data.items() if value != ""}
+            try:
+                item = ProductImportRow.model_validate(data)
+            except ValidationError as e:
+                state.error(row_no, _format_validation_error(e))
+                continue
+
+            batch.append((
+                row_no,
+                item.model_dump(include={"id", *IMPORT_FIELDS}),
+                frozenset(item.model_fields_set & UPDATE_FIELDS)
+            ))
+            if len(batch) >= batch_size:
+                await _write_batch(db, batch, state)
+                batch = []
+
+        if batch:
+            await _write_batch(db, batch, state)
+    finally:
+        # Приращения счетчиков при массовом upsert не считаются - пересчитываем,
+        # даже если импорт прервался после части пачек
+        if settings.PRODUCT_STATS_SOURCE == "counters" and (state.report.created or state.report.updated):
+            await db.rollback()
+            await reconcile_counters(db)
+    return state.report
+
+
+def _export_value(value):
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+async def export_products(fmt: str = "csv", include_inactive: bool = True) -> AsyncIterator[bytes]:
+    """Потоковый экспорт товаров через серверный курсор.
+
+    Открывает собственную сессию: StreamingResponse читает генератор уже
+    после выхода из зависимостей запроса.
+    """
+    query = select(*(getattr(Product, field) for field in EXPORT_FIELDS)).order_by(*PRODUCT_ORDER)
+    if not include_inactive:
+        query = query.filter(Product.is_active == True)
+
+    async with async_session() as session:
+        result = await session.stream(
+            query.execution_options(yield_per=settings.PRODUCT_EXPORT_BATCH_SIZE)
+        )
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_FIELDS)
+            async for rows in result.partitions():
+                writer.writerows([_export_value(value) for value in row] for row in rows)
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                # Пустой каталог - только заголовок
+                yield buffer.getvalue().encode()
+        else:
+            async for rows in result.partitions():
+                yield b"".join(
+                    orjson.dumps(dict(zip(EXPORT_FIELDS, row))) + b"\n" for row in rows
+                )
@@ -0,0 +1,48 @@
+from sqlalchemy import func, or_, literal_column, tuple_
+from sqlalchemy.sql.elements import ColumnElement
+from typing import Optional, Tuple
+
+from app.models.product import Product
+
+# Конфигурации полнотекстового поиска, по которым строится Product.search_vector
+SEARCH_CONFIGS = ("russian", "english")
+
+
+def escape_like(value: str) -> str:
+    """Экранирует спецсимволы LIKE/ILIKE"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def build_tsquery(query: str) -> ColumnElement:
+    """tsquery по всем конфигурациям (совпадение в любой из них)"""
+    tsquery = None
+    for config in SEARCH_CONFIGS:
+        part = func.websearch_to_tsquery(literal_column(f"'{config}'::regconfig"), query)
+        tsquery = part if tsquery is None else tsquery.op("||")(part)
+    return tsquery
+
+
+def search_clause(query: str) -> Tuple[ColumnElement, ColumnElement]:
+    """Условие отбора и оценка релевантности для поисковой строки.
+
+    Полнотекстовое совпадение (GIN по search_vector) дополняется
+    триграммным сходством и подстрокой в названии (GIN gin_trgm_ops),
+    чтобы находились опечатки и незаконченные слова.
+    """
+    query = query.strip()
+    tsquery = build_tsquery(query)
+    condition = or_(
+        Product.search_vector.op("@@")(tsquery),
+        Product.name.op("%")(query),
+        Product.name.ilike(f"%{escape_like(query)}%", escape="\\"),
+    )
+    score = func.ts_rank_cd(Product.search_vector, tsquery) + func.similarity(Product.name, query)
+    return condition, score
+
+
+def after_cursor(score: ColumnElement, cursor: Optional[Tuple[float, object]]) -> Optional[ColumnElement]:
+    """Условие keyset-пагинации для порядка (score DESC, id DESC)"""
+    if cursor is None:
+        return None
+    last_score, last_id = cursor
+    return tuple_(score, Product.id) < tuple_(last_score, last_id)
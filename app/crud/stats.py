@@ -1,63 +1,208 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from typing import Dict, List
+from sqlalchemy import select, delete, insert, func, text, table, column, Integer, String
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+from app.core.config import settings
 from app.models.product import Product
+from app.models.stats import ProductCategoryCounter
 from app.models.user import User
 from app.schema.stats import ProductStats, CategoryStats
 
-async def get_product_stats(db: AsyncSession) -> ProductStats:
-    """Получить статистику по товарам"""
-    # Общее количество товаров
-    total_result = await db.execute(select(func.count(Product.id)))
-    total_products = total_result.scalar() or 0
-    
-    # Активные товары
-    active_result = await db.execute(
-        select(func.count(Product.id)).filter(Product.is_active == True)
-    )
-    active_products = active_result.scalar() or 0
-    
-    # Неактивные товары
-    inactive_products = total_products - active_products
-    
-    # Товары по категориям
-    category_result = await db.execute(
-        select(Product.category, func.count(Product.id))
+logger = logging.getLogger(__name__)
+
+# Порог "низкого запаса" (он же зашит в материализованное представление)
+LOW_STOCK_THRESHOLD = 10
+
+# Материализованное представление со статистикой по категориям
+STATS_VIEW = "product_category_stats"
+product_category_stats = table(
+    STATS_VIEW,
+    column("category", String),
+    column("product_count", Integer),
+    column("active_count", Integer),
+    column("active_stock", Integer),
+    column("low_stock_count", Integer),
+)
+
+# Ключи advisory-lock, чтобы фоновые задачи выполнял один воркер за раз
+_REFRESH_LOCK_KEY = 7_310_017
+_RECONCILE_LOCK_KEY = 7_310_018
+
+# Поля товара, от которых зависят счетчики: (категория, активен, запас)
+StatsSnapshot = Tuple[str, bool, int]
+
+_COUNTER_FIELDS = ("product_count", "active_count", "active_stock", "low_stock_count")
+
+def _live_category_stats():
+    """Все агрегаты по категориям за один проход по products.
+
+    is_active IS NULL - неактивен, stock IS NULL - нулевой запас (как в
+    stats_snapshot и в материализованном представлении).
+    """
+    is_active = Product.is_active.is_(True)
+    stock = func.coalesce(Product.stock, 0)
+    return (
+        select(
+            Product.category,
+            func.count().label("product_count"),
+            func.count().filter(is_active).label("active_count"),
+            func.coalesce(func.sum(stock).filter(is_active), 0).label("active_stock"),
+            func.count().filter(is_active, stock < LOW_STOCK_THRESHOLD).label("low_stock_count"),
+        )
         .group_by(Product.category)
     )
-    products_by_category = dict(category_result.all())
-    
-    # Товары с низким запасом
-    low_stock_result = await db.execute(
-        select(func.count(Product.id)).filter(Product.stock < 10, Product.is_active == True)
-    )
-    low_stock_products = low_stock_result.scalar() or 0
+
+async def _category_rows(db: AsyncSession):
+    if settings.PRODUCT_STATS_SOURCE == "matview":
+        query = select(product_category_stats)
+    elif settings.PRODUCT_STATS_SOURCE == "counters":
+        query = select(ProductCategoryCounter).filter(ProductCategoryCounter.product_count > 0)
+        result = await db.execute(query)
+        return result.scalars().all()
+    else:
+        query = _live_category_stats()
+    result = await db.execute(query)
+    return result.all()
+
+async def get_product_stats(db: AsyncSession) -> ProductStats:
+    """Получить статистику по товарам"""
+    rows = await _category_rows(db)
+    total_products = sum(row.product_count for row in rows)
+    active_products = sum(row.active_count for row in rows)
     
     return ProductStats(
         total_products=total_products,
         active_products=active_products,
-        inactive_products=inactive_products,
-        products_by_category=products_by_category,
-        low_stock_products=low_stock_products
+        inactive_products=total_products - active_products,
+        products_by_category={row.category: row.product_count for row in rows},
+        low_stock_products=sum(row.low_stock_count for row in rows)
     )
 
 async def get_category_stats(db: AsyncSession) -> List[CategoryStats]:
-    """Получить статистику по категориям"""
-    result = await db.execute(
-        select(
-            Product.category,
-            func.count(Product.id).label('product_count'),
-            func.sum(Product.stock).label('total_stock')
-        )
-        .filter(Product.is_active == True)
-        .group_by(Product.category)
-    )
-    
+    """Получить статистику по категориям (только активные товары)"""
+    rows = await _category_rows(db)
     return [
         CategoryStats(
-            category=row[0],
-            product_count=row[1],
-            total_stock=row[2] or 0
+            category=row.category,
+            product_count=row.active_count,
+            total_stock=row.active_stock or 0
         )
-        for row in result.all()
-    ]
\ No newline at end of file
+        for row in rows
+        if row.active_count
+    ]
+
+async def _try_lock(db: AsyncSession, key: int) -> bool:
+    """Advisory-lock до конца транзакции; если он занят - откатывает транзакцию"""
+    locked = await db.execute(select(func.pg_try_advisory_xact_lock(key)))
+    if locked.scalar():
+        return True
+    await db.rollback()
+    return False
+
+async def refresh_stats_view(db: AsyncSession) -> bool:
+    """Обновляет материализованное представление, не блокируя чтение.
+
+    Возвращает False, если его уже обновляет другой воркер.
+    """
+    if not await _try_lock(db, _REFRESH_LOCK_KEY):
+        return False
+    await db.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {STATS_VIEW}"))
+    await db.commit()
+    return True
+
+def stats_snapshot(product) -> StatsSnapshot:
+    """Поля товара для счетчиков (новый товар - после flush, когда выставлены значения по умолчанию).
+
+    is_active IS NULL считается неактивным, как в FILTER (WHERE is_active IS TRUE).
+    """
+    return product.category, product.is_active is True, product.stock or 0
+
+def _contribution(snapshot: StatsSnapshot) -> Dict[str, int]:
+    category, is_active, stock = snapshot
+    return {
+        "product_count": 1,
+        "active_count": int(is_active),
+        "active_stock": stock if is_active else 0,
+        "low_stock_count": int(is_active and stock < LOW_STOCK_THRESHOLD),
+    }
+
+async def record_product_change(
+    db: AsyncSession,
+    before: Optional[StatsSnapshot],
+    after: Optional[StatsSnapshot]
+) -> None:
+    """Применяет к счетчикам разницу между состояниями товара.
+
+    Вызывается в той же транзакции, что и запись товара, до commit.
+    before=None - товар создан, after=None - удален.
+    """
+    await record_product_changes(db, [(before, after)])
+
+async def record_product_changes(
+    db: AsyncSession,
+    changes: Iterable[Tuple[Optional[StatsSnapshot], Optional[StatsSnapshot]]]
+) -> None:
+    """То же для многих товаров сразу: одно приращение на категорию"""
+    if settings.PRODUCT_STATS_SOURCE != "counters":
+        return
+
+    deltas: Dict[str, Dict[str, int]] = {}
+    for before, after in changes:
+        if before == after:
+            continue
+        for snapshot, sign in ((before, -1), (after, 1)):
+            if snapshot is None:
+                continue
+            row = deltas.setdefault(snapshot[0], dict.fromkeys(_COUNTER_FIELDS, 0))
+            for field, value in _contribution(snapshot).items():
+                row[field] += sign * value
+
+    # Категории в одном порядке, чтобы параллельные записи не взаимоблокировались
+    rows = [
+        {"category": category, **values}
+        for category, values in sorted(deltas.items())
+        if any(values.values())
+    ]
+    if not rows:
+        return
+
+    stmt = pg_insert(ProductCategoryCounter).values(rows)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[ProductCategoryCounter.category],
+        set_={
+            field: getattr(ProductCategoryCounter, field) + getattr(stmt.excluded, field)
+            for field in _COUNTER_FIELDS
+        }
+    ))
+
+async def reconcile_counters(db: AsyncSession) -> int:
+    """Пересчитывает счетчики по products, возвращает число исправленных категорий"""
+    if not await _try_lock(db, _RECONCILE_LOCK_KEY):
+        return 0
+    # EXCLUSIVE не мешает чтению счетчиков, но задерживает приращения от
+    # записей товаров до конца пересчета, поэтому они не теряются
+    await db.execute(text(f"LOCK TABLE {ProductCategoryCounter.__tablename__} IN EXCLUSIVE MODE"))
+
+    current = {
+        row.category: tuple(getattr(row, field) for field in _COUNTER_FIELDS)
+        for row in (await db.execute(select(ProductCategoryCounter))).scalars().all()
+    }
+    live = {
+        row.category: tuple(getattr(row, field) for field in _COUNTER_FIELDS)
+        for row in (await db.execute(_live_category_stats())).all()
+    }
+    drifted = sum(
+        1 for category in current.keys() | live.keys()
+        if current.get(category, (0, 0, 0, 0)) != live.get(category, (0, 0, 0, 0))
+    )
+    if drifted:
+        await db.execute(delete(ProductCategoryCounter))
+        if live:
+            await db.execute(insert(ProductCategoryCounter).values([
+                {"category": category, **dict(zip(_COUNTER_FIELDS, values))}
+                for category, values in live.items()
+            ]))
+        logger.warning(f"Product counters drifted in {drifted} categories, reconciled")
+    await db.commit()
+    return drifted
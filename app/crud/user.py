@@ -1,11 +1,15 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from typing import Optional, List
+from typing import AsyncIterator, Optional, List
 import uuid
 
 from app.models.user import User, UserRole
 from app.schema.user import UserCreate, UserInDB, UserOAuthCreate
-from app.core.hashing import get_password_hash, verify_password
+from sqlalchemy import update
+from app.core.hashing import password_hasher
+from app.core.config import settings
+from app.database import async_session
+from app.utils.serialization import type_adapter
 
 async def get_user(db: AsyncSession, user_id: uuid.UUID) -> Optional[User]:
     result = await db.execute(select(User).filter(User.id == user_id))
@@ -32,7 +36,7 @@ async def get_user_by_email(db: AsyncSession, email: str) -> Optional[UserInDB]:
     return None
 
 async def create_user(db: AsyncSession, user_create: UserCreate) -> UserInDB:
-    hashed_password = get_password_hash(user_create.password)
+    hashed_password = await password_hasher.hash(user_create.password)
     db_user = User(
         email=user_create.email,
         hashed_password=hashed_password,
@@ -61,11 +65,38 @@ async def authenticate_user(db: AsyncSession, email: str, password: str) -> Opti
     user = await get_user_by_email(db, email)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    verified, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if not verified:
         return None
+    if new_hash:
+        await update_password_hash(db, user.id, new_hash)
     return user
 
+async def update_password_hash(db: AsyncSession, user_id: uuid.UUID, hashed_password: str) -> None:
+    """Сохранить пересчитанный хеш пароля (например, после смены BCRYPT_ROUNDS)"""
+    await db.execute(
+        update(User).where(User.id == user_id).values(hashed_password=hashed_password)
+    )
+    await db.commit()
+
 async def get_users_by_role(db: AsyncSession, role: UserRole) -> List[UserInDB]:
     result = await db.execute(select(User).filter(User.role == role))
     users = result.scalars().all()
-    return [UserInDB.from_orm(user) for user in users]
\ No newline at end of file
+    return [UserInDB.from_orm(user) for user in users]
+
+async def stream_users(role: Optional[UserRole] = None) -> AsyncIterator[List[UserInDB]]:
+    """Пользователи пачками из серверного курсора.
+
+    Открывает собственную сессию: StreamingResponse читает генератор уже
+    после выхода из зависимостей запроса.
+    """
+    query = select(User).order_by(User.created_at, User.id)
+    if role:
+        query = query.filter(User.role == role)
+
+    async with async_session() as session:
+        result = await session.stream_scalars(
+            query.execution_options(yield_per=settings.LISTING_STREAM_BATCH_SIZE)
+        )
+        async for users in result.partitions():
+            yield type_adapter(List[UserInDB]).validate_python(users, from_attributes=True)
@@ -1,24 +1,183 @@
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.pool import NullPool
-from typing import AsyncGenerator
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import NullPool, AsyncAdaptedQueuePool
+from sqlalchemy.util.queue import AsyncAdaptedQueue, Empty
+from typing import AsyncGenerator, List, Optional
+import itertools
+import threading
+import time
 
 from app.core.config import settings
 
 Base = declarative_base()
 
 
+class PoolWaitStats:
+    """Накопительная статистика ожидания соединения из пула"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.acquisitions = 0
+            self.timeouts = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+
+    def record(self, wait: float, timed_out: bool = False):
+        with self._lock:
+            self.acquisitions += 1
+            self.total_wait += wait
+            if wait > self.max_wait:
+                self.max_wait = wait
+            if timed_out:
+                self.timeouts += 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            avg = self.total_wait / self.acquisitions if self.acquisitions else 0.0
+            return {
+                "acquisitions": self.acquisitions,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(avg * 1000, 3),
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+            }
+
+
+pool_wait_stats = PoolWaitStats()
+
+
+class _InstrumentedQueue(AsyncAdaptedQueue):
+    """Очередь пула, замеряющая только ожидание свободного соединения.
+
+    Установка новых соединений идет в обход очереди и в ожидание не входит.
+    Таймаут - пустая очередь после ожидания (затем пул бросает TimeoutError),
+    ошибки подключения сюда не попадают.
+    """
+
+    def get(self, block: bool = True, timeout: Optional[float] = None):
+        start = time.perf_counter()
+        try:
+            connection = super().get(block, timeout)
+        except Empty:
+            if block:
+                pool_wait_stats.record(time.perf_counter() - start, timed_out=True)
+            else:
+                # Свободных нет, но пул может открыть новое соединение без ожидания
+                pool_wait_stats.record(time.perf_counter() - start)
+            raise
+        pool_wait_stats.record(time.perf_counter() - start)
+        return connection
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, замеряющий время ожидания свободного соединения"""
+
+    _queue_class = _InstrumentedQueue
+
+
+def _engine_options(poolclass=InstrumentedQueuePool) -> dict:
+    """Параметры движка в зависимости от настроек пула"""
+    if settings.DB_USE_NULL_POOL:
+        return {"poolclass": NullPool}
+    return {
+        "poolclass": poolclass,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+    }
+
+
 engine = create_async_engine(
-    str(settings.SQLALCHEMY_DATABASE_URI),  
-    echo=True,
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    echo=settings.DB_ECHO,
     future=True,
-    poolclass=NullPool
+    **_engine_options()
 )
 
 async_session = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
+# Реплики для чтения; ожидание их пулов в pool_wait_stats не попадает
+replica_engines = [
+    create_async_engine(
+        uri,
+        echo=settings.DB_ECHO,
+        future=True,
+        **_engine_options(AsyncAdaptedQueuePool)
+    )
+    for uri in settings.DB_REPLICA_URIS
+]
+
+replica_sessions = [
+    sessionmaker(replica, class_=AsyncSession, expire_on_commit=False)
+    for replica in replica_engines
+]
+
+_replica_cycle = itertools.cycle(replica_sessions) if replica_sessions else None
+
+def read_session(primary: bool = False) -> AsyncSession:
+    """Сессия только для чтения: следующая реплика по кругу.
+
+    Без реплик или с primary=True - сессия основной БД. Данные реплики
+    могут отставать, поэтому писать через эту сессию нельзя.
+    """
+    if primary or _replica_cycle is None:
+        return async_session()
+    return next(_replica_cycle)()
+
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     async with async_session() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """get_db для маршрутов, которые только читают (сессия реплики)"""
+    async with read_session() as session:
+        yield session
+
+_SET_CHANGE_SOURCE = text("SELECT set_config('app.change_source', :source, true)")
+
+@event.listens_for(Session, "after_begin")
+def _apply_change_source(session, transaction, connection):
+    source = session.info.get("change_source")
+    if source is not None:
+        connection.execute(_SET_CHANGE_SOURCE, {"source": source})
+
+async def set_change_source(session: AsyncSession, source: str) -> None:
+    """Помечает все транзакции сессии источником изменения (app.change_source).
+
+    Триггеры передают его в NOTIFY, и лента изменений узнает свои записи.
+    """
+    session.info["change_source"] = source
+    if session.in_transaction():
+        await session.execute(_SET_CHANGE_SOURCE, {"source": source})
+
+def _pool_stats(pool) -> dict:
+    if isinstance(pool, NullPool):
+        return {"pool": "NullPool"}
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+    }
+
+def get_pool_stats() -> dict:
+    """Статистика пула соединений текущего воркера"""
+    stats = _pool_stats(engine.sync_engine.pool)
+    if stats["pool"] != "NullPool":
+        stats.update({
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "timeout": settings.DB_POOL_TIMEOUT,
+            "wait": pool_wait_stats.to_dict(),
+        })
+    if replica_engines:
+        stats["replicas"] = [_pool_stats(replica.sync_engine.pool) for replica in replica_engines]
+    return stats
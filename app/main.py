@@ -4,14 +4,23 @@ from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
 from fastapi_cache.decorator import cache
 import redis.asyncio as redis
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from typing import AsyncGenerator
 import logging
 
 from app.core.config import settings
 from app.api.v1.endpoints import auth, users, cart, products
-from app.database import get_db
+from app.database import get_db, get_pool_stats, async_session
+from app.core.hashing import password_hasher
+from app.services.autocomplete import autocomplete_index
+from app.crud.stats import refresh_stats_view, reconcile_counters
+from app.services.cart_store import cart_store
+from app.services.change_feed import change_feed
+from app.services.product_cache import product_cache
+from app.services.user_cache import user_cache
 from app.logging_config import setup_logging
+from app.utils.serialization import ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 setup_logging()
@@ -20,6 +29,55 @@ setup_logging()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+async def rebuild_autocomplete_index():
+    """Перестраивает индекс автодополнения по данным из БД"""
+    async with async_session() as session:
+        await autocomplete_index.rebuild(session)
+
+async def refresh_autocomplete_periodically(interval: int):
+    """Периодически перестраивает индекс (подхватывает изменения других воркеров)"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await rebuild_autocomplete_index()
+        except Exception as e:
+            logger.error(f"Failed to refresh autocomplete index: {str(e)}")
+
+async def flush_carts():
+    """Сохраняет в Postgres все измененные корзины из Redis"""
+    async with async_session() as session:
+        while await cart_store.flush(session) >= settings.CART_FLUSH_BATCH:
+            pass
+
+async def flush_carts_periodically(interval: float):
+    """Фоновая отложенная запись корзин из Redis в Postgres"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush_carts()
+        except Exception as e:
+            logger.error(f"Failed to flush carts: {str(e)}")
+
+async def refresh_stats_periodically(interval: int):
+    """Периодически обновляет материализованное представление статистики"""
+    while True:
+        try:
+            async with async_session() as session:
+                await refresh_stats_view(session)
+        except Exception as e:
+            logger.error(f"Failed to refresh product stats view: {str(e)}")
+        await asyncio.sleep(interval)
+
+async def reconcile_counters_periodically(interval: int):
+    """Сверяет счетчики товаров с products (при старте и затем периодически)"""
+    while True:
+        try:
+            async with async_session() as session:
+                await reconcile_counters(session)
+        except Exception as e:
+            logger.error(f"Failed to reconcile product counters: {str(e)}")
+        await asyncio.sleep(interval)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator:
     """Управление жизненным циклом приложения"""
@@ -42,9 +100,63 @@ async def lifespan(app: FastAPI) -> AsyncGenerator:
         logger.error(f"Failed to initialize FileStorage: {str(e)}")
         # Не прерываем запуск, т.к. приложение может работать без MinIO
         # Но логируем ошибку для диагностики
+
+    try:
+        await rebuild_autocomplete_index()
+    except Exception as e:
+        logger.error(f"Failed to build autocomplete index: {str(e)}")
+
+    refresh_task = None
+    if settings.AUTOCOMPLETE_REFRESH_SECONDS > 0:
+        refresh_task = asyncio.create_task(
+            refresh_autocomplete_periodically(settings.AUTOCOMPLETE_REFRESH_SECONDS)
+        )
+    
+    flush_task = None
+    if cart_store.enabled:
+        flush_task = asyncio.create_task(flush_carts_periodically(settings.CART_FLUSH_INTERVAL))
+    
+    stats_task = None
+    if settings.PRODUCT_STATS_SOURCE == "matview":
+        stats_task = asyncio.create_task(
+            refresh_stats_periodically(settings.PRODUCT_STATS_REFRESH_SECONDS)
+        )
+    elif settings.PRODUCT_STATS_SOURCE == "counters":
+        stats_task = asyncio.create_task(
+            reconcile_counters_periodically(settings.PRODUCT_COUNTERS_RECONCILE_SECONDS)
+        )
+    
+    # Сбросы кэшей, сделанные другими воркерами, применяем к своему L1
+    invalidation_tasks = [
+        asyncio.create_task(product_cache.listen()),
+        asyncio.create_task(user_cache.cache.listen()),
+    ]
+    # Изменения в обход API (миграции, ручной SQL) приходят через NOTIFY
+    if settings.CHANGE_FEED_ENABLED:
+        invalidation_tasks.append(asyncio.create_task(change_feed.run()))
     
     yield
     
+    for task in invalidation_tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
+    for task in (refresh_task, stats_task):
+        if task:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
+    if flush_task:
+        flush_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await flush_task
+        try:
+            await flush_carts()
+        except Exception as e:
+            logger.error(f"Failed to flush carts on shutdown: {str(e)}")
+
     # Очистка при завершении
     await FastAPICache.clear()
     logger.info("Application shutdown complete")
@@ -59,7 +171,9 @@ app = FastAPI(
         "defaultModelsExpandDepth": -1,
         "persistAuthorization": True
     },
-    lifespan=lifespan
+    lifespan=lifespan,
+    # orjson вместо стандартного json для всех ответов
+    default_response_class=ORJSONResponse
 )
 
 @app.get("/health", include_in_schema=False)
@@ -81,6 +195,16 @@ async def health_check(db: AsyncSession = Depends(get_db)):
             detail=f"Service unavailable: {str(e)}"
         )
 
+@app.get("/health/db-pool", include_in_schema=False)
+async def db_pool_stats():
+    """Статистика пула соединений к БД (для подбора размера пула на воркер)"""
+    return get_pool_stats()
+
+@app.get("/health/password-hashing", include_in_schema=False)
+async def password_hashing_stats():
+    """Загрузка пула хеширования паролей (очередь, отказы, среднее время)"""
+    return password_hasher.stats()
+
 # Настройка CORS
 app.add_middleware(
     CORSMiddleware,
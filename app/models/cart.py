@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey
+from sqlalchemy import Column, Integer, ForeignKey, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -12,8 +12,14 @@ class CartItem(Base):
     product_id = Column(UUID(as_uuid=True), ForeignKey("products.id"), nullable=False)
     quantity = Column(Integer, default=1)
     
-    # Relationship с продуктом
-    product = relationship("Product", lazy="select")
+    # Relationship с продуктом. Неявная загрузка запрещена, чтобы не было
+    # запроса на каждый элемент: товары берутся через ProductLoader
+    product = relationship("Product", lazy="raise")
+
+    # Один товар - одна строка в корзине пользователя
+    __table_args__ = (
+        UniqueConstraint("user_id", "product_id", name="uq_cart_items_user_product"),
+    )
 
     def __repr__(self):
         return f"<CartItem(id={self.id}, user_id={self.user_id}, product_id={self.product_id}, quantity={self.quantity})>"
\ No newline at end of file
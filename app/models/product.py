@@ -1,9 +1,20 @@
-from sqlalchemy import Column, DateTime, String, Float, Integer, Boolean, Text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, DateTime, String, Float, Integer, Boolean, Text, Index, Computed
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from app.database import Base
 import uuid
 
+# Поисковый вектор: название (вес A), категория (B) и описание (C)
+# в русской и английской конфигурациях
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('russian'::regconfig, coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('russian'::regconfig, coalesce(category, '')), 'B') || "
+    "setweight(to_tsvector('russian'::regconfig, coalesce(description, '')), 'C') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'C')"
+)
+
 class Product(Base):
     __tablename__ = "products"
 
@@ -21,6 +32,21 @@ class Product(Base):
     sku = Column(String(50), unique=True, nullable=True)  # Артикул
     weight = Column(Float, default=0.0)  # Вес в кг
     dimensions = Column(String(50), nullable=True)  # Размеры (например: "10x20x30")
+    # Генерируемая колонка, Postgres сам пересчитывает ее при записи
+    search_vector = deferred(Column(TSVECTOR, Computed(SEARCH_VECTOR_SQL, persisted=True)))
+
+    # Индексы под курсорную пагинацию по (created_at, id)
+    __table_args__ = (
+        Index("ix_products_created_at_id", "created_at", "id"),
+        Index("ix_products_active_created_at_id", "is_active", "created_at", "id"),
+        Index("ix_products_category_active_created_at_id", "category", "is_active", "created_at", "id"),
+        # Индексы полнотекстового и триграммного поиска
+        Index("ix_products_search_vector", "search_vector", postgresql_using="gin"),
+        Index(
+            "ix_products_name_trgm", "name",
+            postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}
+        ),
+    )
 
     def __repr__(self):
         return f"<Product(id={self.id}, name={self.name}, price={self.price})>"
\ No newline at end of file
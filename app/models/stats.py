@@ -0,0 +1,15 @@
+from sqlalchemy import Column, String, Integer
+from app.database import Base
+
+class ProductCategoryCounter(Base):
+    """Счетчики товаров по категории, обновляются приращениями при записи товаров"""
+    __tablename__ = "product_category_counters"
+
+    category = Column(String(50), primary_key=True)
+    product_count = Column(Integer, nullable=False, default=0)
+    active_count = Column(Integer, nullable=False, default=0)
+    active_stock = Column(Integer, nullable=False, default=0)
+    low_stock_count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ProductCategoryCounter(category={self.category}, product_count={self.product_count})>"
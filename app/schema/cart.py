@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, validator
+from typing import Optional, List, Literal
 from uuid import UUID
 from app.schema.product import ProductInDB
 
@@ -19,4 +19,19 @@ class CartItemInDB(CartItemBase):
     product: Optional[ProductInDB] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class CartOperation(BaseModel):
+    """Одна операция пакетного изменения корзины"""
+    op: Literal["add", "update", "remove"]
+    product_id: UUID
+    quantity: Optional[int] = Field(None, ge=1)
+
+    @validator('quantity', always=True)
+    def quantity_required(cls, v, values):
+        if values.get('op') in ("add", "update") and v is None:
+            raise ValueError("Quantity is required for add and update operations")
+        return v
+
+class CartBatchRequest(BaseModel):
+    operations: List[CartOperation] = Field(..., min_length=1, max_length=100)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, List
 from uuid import UUID
 from datetime import datetime
 
@@ -37,4 +37,82 @@ class ProductInDB(ProductBase):
     image_url: Optional[str] = None 
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class ProductPage(BaseModel):
+    """Страница товаров для курсорной пагинации"""
+    items: List[ProductInDB]
+    next_cursor: Optional[str] = None
+
+class AutocompleteSuggestion(BaseModel):
+    """Подсказка поиска: товар, артикул или категория"""
+    type: str  # "product", "sku" или "category"
+    value: str
+    product_id: Optional[UUID] = None
+
+class ProductImportRow(ProductCreate):
+    """Строка массового импорта (обновляется товар с тем же id, а без id - с тем же sku)"""
+    id: Optional[UUID] = None
+    is_active: bool = True  # Только для новых товаров: у существующих меняются заданные поля
+
+class ImportRowError(BaseModel):
+    row: int  # Номер строки во входном файле
+    error: str
+
+class ProductImportReport(BaseModel):
+    """Итог массового импорта"""
+    processed: int = 0
+    created: int = 0
+    updated: int = 0
+    failed: int = 0
+    errors: List[ImportRowError] = []
+    errors_truncated: bool = False
+
+class ProductSelector(BaseModel):
+    """Какие товары затрагивает массовая операция (условия объединяются через AND)"""
+    ids: Optional[List[UUID]] = Field(None, min_length=1, max_length=10000)
+    category: Optional[str] = None
+    is_active: Optional[bool] = None
+
+    @model_validator(mode="after")
+    def not_empty(self):
+        if self.ids is None and self.category is None and self.is_active is None:
+            raise ValueError("Specify ids, category or is_active")
+        return self
+
+class ProductBulkFields(BaseModel):
+    """Поля, выставляемые всем выбранным товарам"""
+    description: Optional[str] = Field(None, max_length=1000)
+    price: Optional[float] = Field(None, gt=0)
+    stock: Optional[int] = Field(None, ge=0)
+    category: Optional[str] = Field(None, max_length=50)
+    weight: Optional[float] = Field(None, ge=0)
+    dimensions: Optional[str] = Field(None, max_length=50)
+    is_active: Optional[bool] = None
+
+class ProductBulkUpdate(BaseModel):
+    """Массовое изменение: поля, изменение цены в процентах и/или переключение активности"""
+    where: ProductSelector
+    set: Optional[ProductBulkFields] = None
+    price_percent: Optional[float] = Field(None, gt=-100, le=1000)  # -10 - скидка 10%
+    toggle_active: bool = False
+
+    @model_validator(mode="after")
+    def consistent(self):
+        # null не меняет поле, как и в обычном обновлении товара
+        fields = self.set.model_dump(exclude_unset=True, exclude_none=True) if self.set else {}
+        if not fields and self.price_percent is None and not self.toggle_active:
+            raise ValueError("Nothing to update")
+        if "price" in fields and self.price_percent is not None:
+            raise ValueError("Use either set.price or price_percent")
+        if "is_active" in fields and self.toggle_active:
+            raise ValueError("Use either set.is_active or toggle_active")
+        return self
+
+class ProductBulkDelete(BaseModel):
+    where: ProductSelector
+
+class ProductBulkResult(BaseModel):
+    """Итог массовой операции"""
+    affected: int
+    ids: List[UUID]
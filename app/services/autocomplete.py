@@ -0,0 +1,175 @@
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import logging
+import re
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.product import Product
+
+logger = logging.getLogger(__name__)
+
+# Элемент индекса: (ключ, тип, отображаемое значение, id товара или "")
+Entry = Tuple[str, str, str, str]
+# Изменение во время перестройки: (id товара, название, артикул, категория, активен)
+# или (id товара, None, None, None, False) для удаления
+Mutation = Tuple[str, Optional[str], Optional[str], Optional[str], bool]
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(value: str) -> str:
+    """Приводит строку к виду, по которому ищется префикс"""
+    return _SPACES.sub(" ", value.casefold().replace("ё", "е")).strip()
+
+
+class AutocompleteIndex:
+    """Префиксный индекс названий, артикулов и категорий активных товаров.
+
+    Хранится в памяти процесса как отсортированный список, поиск префикса
+    выполняется через bisect без обращения к БД.
+    """
+
+    def __init__(self):
+        self._entries: List[Entry] = []
+        self._by_product: Dict[str, List[Entry]] = {}
+        self._categories: Counter = Counter()
+        self._category_of: Dict[str, str] = {}
+        # Журналы изменений идущих перестроек
+        self._rebuild_logs: List[List[Mutation]] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _product_entries(self, product_id: str, name: str, sku: Optional[str]) -> List[Entry]:
+        entries = []
+        words = normalize(name).split(" ")
+        # Каждый суффикс названия, начиная с границы слова: "гарнитур модерн", "модерн"
+        for i in range(len(words)):
+            entries.append((" ".join(words[i:]), "product", name, product_id))
+        if sku:
+            entries.append((normalize(sku), "sku", sku, product_id))
+        return list(dict.fromkeys(entries))
+
+    def _add_category(self, category: str):
+        self._categories[category] += 1
+        if self._categories[category] == 1:
+            insort(self._entries, (normalize(category), "category", category, ""))
+
+    def _remove_category(self, category: str):
+        self._categories[category] -= 1
+        if self._categories[category] <= 0:
+            del self._categories[category]
+            self._delete((normalize(category), "category", category, ""))
+
+    def _delete(self, entry: Entry):
+        i = bisect_left(self._entries, entry)
+        if i < len(self._entries) and self._entries[i] == entry:
+            del self._entries[i]
+
+    def _add(self, product_id: str, name: str, sku: Optional[str], category: str):
+        entries = self._product_entries(product_id, name, sku)
+        for entry in entries:
+            insort(self._entries, entry)
+        self._by_product[product_id] = entries
+        self._category_of[product_id] = category
+        self._add_category(category)
+
+    def _log(self, mutation: Mutation) -> None:
+        for log in self._rebuild_logs:
+            log.append(mutation)
+
+    def remove(self, product_id) -> None:
+        """Убирает товар из индекса"""
+        product_id = str(product_id)
+        self._log((product_id, None, None, None, False))
+        self._remove(product_id)
+
+    def _remove(self, product_id: str) -> None:
+        for entry in self._by_product.pop(product_id, []):
+            self._delete(entry)
+        category = self._category_of.pop(product_id, None)
+        if category is not None:
+            self._remove_category(category)
+
+    def upsert(self, product: Product) -> None:
+        """Обновляет товар в индексе (неактивные товары удаляются)"""
+        mutation = (str(product.id), product.name, product.sku, product.category, bool(product.is_active))
+        self._log(mutation)
+        self._apply(mutation)
+
+    def _apply(self, mutation: Mutation) -> None:
+        product_id, name, sku, category, is_active = mutation
+        self._remove(product_id)
+        if is_active:
+            self._add(product_id, name, sku, category)
+
+    def search(self, prefix: str, limit: int = 10) -> List[dict]:
+        """Подсказки по префиксу: товары (по названию или артикулу) и категории"""
+        key = normalize(prefix)
+        if not key:
+            return []
+
+        results = []
+        seen = set()
+        i = bisect_left(self._entries, (key,))
+        while i < len(self._entries) and len(results) < limit:
+            entry_key, kind, value, product_id = self._entries[i]
+            i += 1
+            if not entry_key.startswith(key):
+                break
+            marker = product_id or (kind, value)
+            if marker in seen:
+                continue
+            seen.add(marker)
+            results.append({
+                "type": kind,
+                "value": value,
+                "product_id": product_id or None,
+            })
+        return results
+
+    async def rebuild(self, db: AsyncSession) -> None:
+        """Полностью перестраивает индекс по таблице products.
+
+        Изменения, пришедшие во время запроса к БД, записываются и
+        повторяются поверх нового индекса, иначе они потерялись бы при подмене.
+        """
+        log: List[Mutation] = []
+        self._rebuild_logs.append(log)
+        try:
+            result = await db.execute(
+                select(Product.id, Product.name, Product.sku, Product.category)
+                .filter(Product.is_active == True)
+            )
+            rows = result.all()
+        finally:
+            self._rebuild_logs.remove(log)
+        entries: List[Entry] = []
+        by_product: Dict[str, List[Entry]] = {}
+        categories: Counter = Counter()
+        category_of: Dict[str, str] = {}
+        for product_id, name, sku, category in rows:
+            product_id = str(product_id)
+            product_entries = self._product_entries(product_id, name, sku)
+            entries.extend(product_entries)
+            by_product[product_id] = product_entries
+            category_of[product_id] = category
+            categories[category] += 1
+        entries.extend((normalize(c), "category", c, "") for c in categories)
+        entries.sort()
+
+        # Подменяем состояние целиком, чтобы поиск не видел полупостроенный индекс
+        self._entries = entries
+        self._by_product = by_product
+        self._categories = categories
+        self._category_of = category_of
+        for mutation in log:
+            self._apply(mutation)
+        logger.info(f"Autocomplete index rebuilt: {len(by_product)} products, {len(entries)} entries")
+
+
+# Глобальный экземпляр индекса (свой в каждом воркере)
+autocomplete_index = AutocompleteIndex()
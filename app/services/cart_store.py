@@ -0,0 +1,399 @@
+from typing import Dict, Optional, Tuple
+import logging
+import time
+import uuid
+
+import redis.asyncio as redis
+from sqlalchemy import select, delete, func, cast
+from sqlalchemy.dialects.postgresql import ARRAY, UUID, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.database import set_change_source
+from app.models.cart import CartItem
+from app.models.product import Product
+
+logger = logging.getLogger(__name__)
+
+# Содержимое корзины: product_id -> (cart_item_id, quantity)
+CartContents = Dict[uuid.UUID, Tuple[uuid.UUID, int]]
+
+DIRTY_KEY = "cart:dirty"
+# Корзины, которые сейчас пишутся в Postgres (score - время захвата)
+FLUSHING_KEY = "cart:flushing"
+ITEM_KEY_PREFIX = "cart:item:"
+# Строк в одном INSERT при записи корзин: 4 параметра на строку,
+# а asyncpg принимает не больше 32767 параметров в запросе
+INSERT_CHUNK_SIZE = 5000
+VERSION_FIELD = "_v"
+# Источник изменения для ленты изменений: свои записи она пропускает
+CHANGE_SOURCE = "cart_store"
+
+# Заполняет корзину, только если ее еще нет в Redis (иначе можно затереть
+# изменения, сделанные другим воркером после нашего чтения из Postgres)
+_LOAD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# Изменения корзины пишутся, только если ее хеш еще есть в Redis: иначе
+# HINCRBY/HSET создали бы корзину из одной строки, и flush() затер бы ею
+# всю корзину в Postgres. При отсутствии ключа вызывающий загружает корзину
+# заново и повторяет запись. Заодно корзина отмечается измененной.
+# KEYS[1] - корзина, KEYS[2] - cart:dirty, ARGV[1] - user_id
+_TOUCH_LUA = """
+redis.call('HINCRBY', KEYS[1], '_v', 1)
+redis.call('PERSIST', KEYS[1])
+redis.call('SADD', KEYS[2], ARGV[1])
+"""
+
+# ARGV[2] - product_id, ARGV[3] - приращение, ARGV[4] - id новой строки,
+# ARGV[5] - наибольшее допустимое количество (остаток); при превышении
+# ничего не пишет и возвращает 0
+_INCREMENT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+local current = tonumber(redis.call('HGET', KEYS[1], 'q:' .. ARGV[2]) or '0')
+if current + tonumber(ARGV[3]) > tonumber(ARGV[5]) then
+    return 0
+end
+local quantity = redis.call('HINCRBY', KEYS[1], 'q:' .. ARGV[2], ARGV[3])
+redis.call('HSETNX', KEYS[1], 'i:' .. ARGV[2], ARGV[4])
+local item_id = redis.call('HGET', KEYS[1], 'i:' .. ARGV[2])
+""" + _TOUCH_LUA + """
+return {item_id, quantity}
+"""
+
+# ARGV[2..] - тройки (product_id, количество, id новой строки), 0 - удалить;
+# возвращает id удаленных строк и содержимое корзины
+_SET_QUANTITIES_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+local removed = {}
+for i = 2, #ARGV, 3 do
+    local product_id, quantity = ARGV[i], tonumber(ARGV[i + 1])
+    if quantity > 0 then
+        redis.call('HSET', KEYS[1], 'q:' .. product_id, quantity)
+        redis.call('HSETNX', KEYS[1], 'i:' .. product_id, ARGV[i + 2])
+    else
+        local item_id = redis.call('HGET', KEYS[1], 'i:' .. product_id)
+        if item_id then
+            table.insert(removed, item_id)
+        end
+        redis.call('HDEL', KEYS[1], 'q:' .. product_id, 'i:' .. product_id)
+    end
+end
+""" + _TOUCH_LUA + """
+return {removed, redis.call('HGETALL', KEYS[1])}
+"""
+
+# Очищает корзину целиком: удаляет строки и их индекс, версию сохраняет
+# и увеличивает. ARGV[2] - префикс ключей индекса строк
+_CLEAR_SCRIPT = """
+local fields = redis.call('HGETALL', KEYS[1])
+for i = 1, #fields, 2 do
+    local field = fields[i]
+    if field ~= '_v' then
+        if string.sub(field, 1, 2) == 'i:' then
+            redis.call('DEL', ARGV[2] .. fields[i + 1])
+        end
+        redis.call('HDEL', KEYS[1], field)
+    end
+end
+""" + _TOUCH_LUA
+
+# Забирает пачку корзин на запись, перекладывая их из cart:dirty в
+# cart:flushing; заодно возвращает в очередь корзины, запись которых
+# началась раньше ARGV[3] и так и не завершилась (воркер упал).
+# KEYS[1] - cart:dirty, KEYS[2] - cart:flushing,
+# ARGV[1] - размер пачки, ARGV[2] - текущее время, ARGV[3] - граница
+_CLAIM_SCRIPT = """
+local stale = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[3])
+for _, user_id in ipairs(stale) do
+    redis.call('SADD', KEYS[1], user_id)
+    redis.call('ZREM', KEYS[2], user_id)
+end
+local user_ids = redis.call('SPOP', KEYS[1], ARGV[1])
+for _, user_id in ipairs(user_ids) do
+    redis.call('ZADD', KEYS[2], ARGV[2], user_id)
+end
+return user_ids
+"""
+
+# После записи в Postgres возвращает TTL, только если версия не изменилась,
+# иначе снова ставит корзину в очередь (одной атомарной операцией).
+# KEYS[1] - корзина, KEYS[2] - cart:dirty, KEYS[3] - cart:flushing,
+# KEYS[4..] - ключи строк, ARGV[1] - записанная версия, ARGV[2] - user_id,
+# ARGV[3] - TTL
+_SETTLE_SCRIPT = """
+redis.call('ZREM', KEYS[3], ARGV[2])
+if redis.call('HGET', KEYS[1], '_v') ~= ARGV[1] then
+    redis.call('SADD', KEYS[2], ARGV[2])
+    return 0
+end
+for i = 1, #KEYS do
+    if i ~= 2 and i ~= 3 then
+        redis.call('EXPIRE', KEYS[i], ARGV[3])
+    end
+end
+return 1
+"""
+
+
+def _cart_key(user_id: uuid.UUID) -> str:
+    return f"cart:{user_id}"
+
+
+def _item_key(item_id: uuid.UUID) -> str:
+    return f"{ITEM_KEY_PREFIX}{item_id}"
+
+
+def _parse(raw: Dict[str, str]) -> CartContents:
+    contents = {}
+    for field, value in raw.items():
+        if field.startswith("q:"):
+            product_id = field[2:]
+            item_id = raw.get(f"i:{product_id}")
+            if item_id and int(value) > 0:
+                contents[uuid.UUID(product_id)] = (uuid.UUID(item_id), int(value))
+    return contents
+
+
+class RedisCartStore:
+    """Горячее хранилище корзин в Redis с отложенной записью в cart_items.
+
+    Корзина пользователя хранится хешем cart:{user_id} с полями
+    q:{product_id} (количество), i:{product_id} (id строки cart_items)
+    и _v (версия). Измененные корзины попадают в множество cart:dirty,
+    откуда их пачками сохраняет в Postgres фоновая задача flush().
+    На время записи корзина лежит в cart:flushing, чтобы после падения
+    воркера ее снова поставили в очередь.
+    """
+
+    def __init__(self):
+        self.redis = redis.from_url(str(settings.REDIS_URI), decode_responses=True)
+        self._load_script = self.redis.register_script(_LOAD_SCRIPT)
+        self._increment_script = self.redis.register_script(_INCREMENT_SCRIPT)
+        self._set_quantities_script = self.redis.register_script(_SET_QUANTITIES_SCRIPT)
+        self._clear_script = self.redis.register_script(_CLEAR_SCRIPT)
+        self._claim_script = self.redis.register_script(_CLAIM_SCRIPT)
+        self._settle_script = self.redis.register_script(_SETTLE_SCRIPT)
+
+    @property
+    def enabled(self) -> bool:
+        return settings.CART_STORE == "redis"
+
+    async def get(self, user_id: uuid.UUID) -> Optional[CartContents]:
+        """Содержимое корзины или None, если ее нет в Redis"""
+        raw = await self.redis.hgetall(_cart_key(user_id))
+        if not raw:
+            return None
+        return _parse(raw)
+
+    async def ensure_loaded(self, db: AsyncSession, user_id: uuid.UUID) -> CartContents:
+        """Возвращает корзину, при промахе восстанавливая ее из Postgres"""
+        contents = await self.get(user_id)
+        if contents is not None:
+            return contents
+
+        result = await db.execute(
+            select(CartItem.id, CartItem.product_id, CartItem.quantity)
+            .filter(CartItem.user_id == user_id)
+        )
+        contents = {row.product_id: (row.id, row.quantity) for row in result.all()}
+
+        fields = [VERSION_FIELD, "0"]
+        for product_id, (item_id, quantity) in contents.items():
+            fields += [f"q:{product_id}", str(quantity), f"i:{product_id}", str(item_id)]
+        loaded = await self._load_script(
+            keys=[_cart_key(user_id)],
+            args=[settings.CART_CACHE_TTL] + fields
+        )
+        if not loaded:
+            # Корзину успели загрузить параллельно - берем актуальную версию
+            return await self.get(user_id) or {}
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for product_id, (item_id, _) in contents.items():
+                pipe.set(_item_key(item_id), f"{user_id}:{product_id}", ex=settings.CART_CACHE_TTL)
+            await pipe.execute()
+        return contents
+
+    async def find_item(self, item_id: uuid.UUID) -> Optional[Tuple[uuid.UUID, uuid.UUID]]:
+        """(user_id, product_id) строки корзины по ее id"""
+        value = await self.redis.get(_item_key(item_id))
+        if not value:
+            return None
+        user_id, product_id = value.split(":")
+        return uuid.UUID(user_id), uuid.UUID(product_id)
+
+    async def _run_loaded(self, db: AsyncSession, user_id: uuid.UUID, script, args: list):
+        """Выполняет скрипт записи; если корзина пропала из Redis - загружает и повторяет"""
+        keys = [_cart_key(user_id), DIRTY_KEY]
+        result = await script(keys=keys, args=[str(user_id)] + args)
+        if result is None:
+            await self.ensure_loaded(db, user_id)
+            result = await script(keys=keys, args=[str(user_id)] + args)
+            if result is None:
+                raise RuntimeError(f"Cart {user_id} disappeared from Redis during update")
+        return result
+
+    async def increment(
+        self,
+        db: AsyncSession,
+        user_id: uuid.UUID,
+        product_id: uuid.UUID,
+        quantity: int,
+        max_quantity: int
+    ) -> Optional[Tuple[uuid.UUID, int]]:
+        """Атомарно увеличивает количество товара, возвращает (item_id, новое количество).
+
+        Если новое количество превысило бы max_quantity, корзина не
+        меняется и возвращается None.
+        """
+        result = await self._run_loaded(
+            db, user_id, self._increment_script,
+            [str(product_id), quantity, str(uuid.uuid4()), max_quantity]
+        )
+        if not result:
+            return None
+        item_id, new_quantity = result
+        await self._index_items(user_id, {uuid.UUID(item_id): product_id})
+        return uuid.UUID(item_id), new_quantity
+
+    async def set_quantities(
+        self,
+        db: AsyncSession,
+        user_id: uuid.UUID,
+        quantities: Dict[uuid.UUID, int]
+    ) -> CartContents:
+        """Устанавливает количества (0 - удалить товар), возвращает новое содержимое"""
+        args = []
+        for product_id, quantity in quantities.items():
+            args += [str(product_id), max(quantity, 0), str(uuid.uuid4())]
+        removed_items, raw = await self._run_loaded(db, user_id, self._set_quantities_script, args)
+        contents = _parse(dict(zip(raw[::2], raw[1::2])))
+        if removed_items:
+            await self.redis.delete(*(_item_key(item_id) for item_id in removed_items))
+        await self._index_items(user_id, {
+            contents[pid][0]: pid for pid in quantities if pid in contents
+        })
+        return contents
+
+    async def clear(self, user_id: uuid.UUID) -> None:
+        """Очищает корзину (ключ остается, чтобы пустая корзина не считалась промахом)"""
+        await self._clear_script(
+            keys=[_cart_key(user_id), DIRTY_KEY],
+            args=[str(user_id), ITEM_KEY_PREFIX]
+        )
+
+    async def discard(self, user_id: uuid.UUID) -> bool:
+        """Убирает корзину из Redis, чтобы следующее чтение взяло ее из Postgres.
+
+        Корзину с еще не сохраненными изменениями не трогаем: иначе они
+        потеряются, а flush() все равно перезапишет строки в Postgres.
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.sismember(DIRTY_KEY, str(user_id))
+            pipe.zscore(FLUSHING_KEY, str(user_id))
+            dirty, flushing = await pipe.execute()
+        if dirty or flushing is not None:
+            logger.warning(f"Cart {user_id} changed in Postgres while it has unsaved changes in Redis")
+            return False
+        key = _cart_key(user_id)
+        raw = await self.redis.hgetall(key)
+        item_keys = [_item_key(v) for f, v in raw.items() if f.startswith("i:")]
+        await self.redis.delete(key, *item_keys)
+        return True
+
+    async def _index_items(self, user_id: uuid.UUID, items: Dict[uuid.UUID, uuid.UUID]) -> None:
+        """Индекс item_id -> (user_id, product_id) для строк корзины (без TTL до записи)"""
+        if not items:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for item_id, product_id in items.items():
+                pipe.set(_item_key(item_id), f"{user_id}:{product_id}")
+            await pipe.execute()
+
+    async def flush(self, db: AsyncSession, batch_size: Optional[int] = None) -> int:
+        """Сохраняет пачку измененных корзин в cart_items.
+
+        Возвращает число корзин, взятых из очереди (включая пропущенные):
+        меньше размера пачки - очередь разобрана.
+        """
+        now = time.time()
+        user_ids = await self._claim_script(
+            keys=[DIRTY_KEY, FLUSHING_KEY],
+            args=[batch_size or settings.CART_FLUSH_BATCH, now, now - settings.CART_FLUSH_TIMEOUT]
+        )
+        if not user_ids:
+            return 0
+
+        snapshots = {}
+        for user_id in user_ids:
+            raw = await self.redis.hgetall(_cart_key(user_id))
+            # Пропавшую из Redis корзину не сохраняем, иначе она затрет строки в Postgres.
+            # Хеш без версии загружен не через ensure_loaded - тоже не сохраняем
+            if raw and VERSION_FIELD in raw:
+                snapshots[uuid.UUID(user_id)] = (raw.get(VERSION_FIELD), _parse(raw))
+        skipped = set(user_ids) - {str(user_id) for user_id in snapshots}
+        if skipped:
+            await self.redis.zrem(FLUSHING_KEY, *skipped)
+        if not snapshots:
+            return len(user_ids)
+
+        try:
+            await set_change_source(db, CHANGE_SOURCE)
+            product_ids = {pid for _, contents in snapshots.values() for pid in contents}
+            existing = set()
+            if product_ids:
+                result = await db.execute(
+                    select(Product.id).filter(
+                        Product.id == func.any(cast(list(product_ids), ARRAY(UUID(as_uuid=True))))
+                    )
+                )
+                existing = set(result.scalars().all())
+
+            rows = [
+                {"id": item_id, "user_id": user_id, "product_id": product_id, "quantity": quantity}
+                for user_id, (_, contents) in snapshots.items()
+                for product_id, (item_id, quantity) in contents.items()
+                if product_id in existing
+            ]
+            await db.execute(delete(CartItem).filter(CartItem.user_id.in_(list(snapshots))))
+            for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+                await db.execute(pg_insert(CartItem).values(rows[start:start + INSERT_CHUNK_SIZE]))
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            requeued = [str(user_id) for user_id in snapshots]
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.sadd(DIRTY_KEY, *requeued)
+                pipe.zrem(FLUSHING_KEY, *requeued)
+                await pipe.execute()
+            raise
+
+        # Корзины, изменившиеся во время записи, возвращаем в очередь,
+        # остальным снова выставляем TTL
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for user_id, (version, contents) in snapshots.items():
+                await self._settle_script(
+                    keys=[_cart_key(user_id), DIRTY_KEY, FLUSHING_KEY]
+                    + [_item_key(item_id) for item_id, _ in contents.values()],
+                    args=[version, str(user_id), settings.CART_CACHE_TTL],
+                    client=pipe
+                )
+            await pipe.execute()
+
+        logger.debug(f"Flushed {len(snapshots)} carts ({len(rows)} items) to Postgres")
+        return len(user_ids)
+
+
+# Глобальный экземпляр хранилища корзин
+cart_store = RedisCartStore()
@@ -0,0 +1,154 @@
+from types import SimpleNamespace
+from typing import List, Optional, Set
+import asyncio
+import json
+import logging
+import uuid
+
+import asyncpg
+
+from app.core.config import settings
+from app.database import async_session
+from app.services.autocomplete import autocomplete_index
+from app.services.cart_store import cart_store, CHANGE_SOURCE as CART_STORE_SOURCE
+from app.services.file_storage import file_storage
+from app.services.product_cache import product_cache, CHANGE_SOURCE as API_SOURCE
+from app.services.user_cache import user_cache
+
+logger = logging.getLogger(__name__)
+
+# Канал, в который пишет триггерная функция notify_app_change()
+CHANNEL = "app_changes"
+
+
+def _listener_dsn() -> str:
+    """DSN для asyncpg из URI SQLAlchemy"""
+    return str(settings.SQLALCHEMY_DATABASE_URI).replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+class _Invalidation:
+    """Товары и категории, кэш которых нужно сбросить после пачки событий"""
+
+    def __init__(self):
+        self.product_ids: Set[uuid.UUID] = set()
+        self.categories: Set[Optional[str]] = set()
+
+
+class ChangeFeed:
+    """Слушатель NOTIFY от триггеров на products, users и cart_items.
+
+    Каждый воркер держит свое соединение LISTEN и сам обновляет свои
+    индексы и L1, поэтому сбросы из ленты не рассылаются через Redis.
+    Изменения, сделанные в обход API (миграции, ручной SQL, другие сервисы),
+    так же сбрасывают кэши, как и записи через crud/*. События применяются
+    пачками: массовое изменение тысяч строк дает один сброс кэша каталога.
+    """
+
+    def __init__(self):
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._handlers = {
+            "products": self._handle_product,
+            "users": self._handle_user,
+            "cart_items": self._handle_cart_item,
+        }
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        self._queue.put_nowait(payload)
+
+    async def _consume(self) -> None:
+        while True:
+            payloads = [await self._queue.get()]
+            while not self._queue.empty() and len(payloads) < settings.CHANGE_FEED_BATCH_SIZE:
+                payloads.append(self._queue.get_nowait())
+            await self.handle(payloads)
+
+    async def handle(self, payloads: List[str]) -> None:
+        """Применяет пачку событий к кэшам и индексам"""
+        pending = _Invalidation()
+        for payload in payloads:
+            try:
+                event = json.loads(payload)
+                handler = self._handlers.get(event.get("table"))
+                if handler is not None:
+                    await handler(event.get("old") or {}, event.get("new") or {}, event.get("source"), pending)
+            except Exception as e:
+                logger.error(f"Failed to handle change event {payload}: {e}")
+
+        if pending.product_ids:
+            try:
+                await product_cache.invalidate_many(pending.product_ids, pending.categories, broadcast=False)
+            except Exception as e:
+                logger.error(f"Failed to invalidate {len(pending.product_ids)} changed products: {e}")
+
+    async def _handle_product(self, old: dict, new: dict, source: Optional[str], pending: _Invalidation) -> None:
+        product_id = uuid.UUID((new or old)["id"])
+        # Индекс автодополнения у каждого воркера свой - обновляем при любом источнике
+        if new:
+            autocomplete_index.upsert(SimpleNamespace(**new))
+        else:
+            autocomplete_index.remove(product_id)
+
+        old_image = old.get("image_object_name")
+        if old_image and old_image != new.get("image_object_name"):
+            file_storage.invalidate_image_url(old_image)
+
+        # Кэш после записей через API уже сброшен во всех воркерах
+        if source == API_SOURCE:
+            return
+        pending.product_ids.add(product_id)
+        pending.categories.update((old.get("category"), new.get("category")))
+
+    async def _handle_user(self, old: dict, new: dict, source: Optional[str], pending: _Invalidation) -> None:
+        for email in {old.get("email"), new.get("email")} - {None}:
+            await user_cache.invalidate(email, broadcast=False)
+
+    async def _handle_cart_item(self, old: dict, new: dict, source: Optional[str], pending: _Invalidation) -> None:
+        # Собственные записи хранилища корзин в Redis уже отражены
+        if not cart_store.enabled or source == CART_STORE_SOURCE:
+            return
+        for user_id in {old.get("user_id"), new.get("user_id")} - {None}:
+            await cart_store.discard(uuid.UUID(user_id))
+
+    async def _resync(self) -> None:
+        """После переподключения: события могли потеряться, сбрасываем локальное состояние"""
+        async with async_session() as session:
+            await autocomplete_index.rebuild(session)
+        product_cache.cache.clear_local()
+        user_cache.cache.clear_local()
+
+    async def run(self) -> None:
+        """Слушает канал до отмены, переподключаясь при обрыве соединения"""
+        consumer = asyncio.create_task(self._consume())
+        reconnected = False
+        try:
+            while True:
+                connection = None
+                try:
+                    connection = await asyncpg.connect(_listener_dsn())
+                    await connection.add_listener(CHANNEL, self._on_notify)
+                    logger.info("Change feed listener connected")
+                    if reconnected:
+                        await self._resync()
+                    reconnected = True
+
+                    # asyncpg не замечает тихий обрыв соединения, проверяем его сами
+                    while not connection.is_closed():
+                        await asyncio.sleep(settings.CHANGE_FEED_KEEPALIVE)
+                        await asyncio.wait_for(
+                            connection.execute("SELECT 1"),
+                            timeout=settings.CHANGE_FEED_KEEPALIVE
+                        )
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Change feed listener disconnected, reconnecting: {e}")
+                    await asyncio.sleep(1)
+                finally:
+                    if connection is not None and not connection.is_closed():
+                        await connection.close()
+        finally:
+            consumer.cancel()
+
+
+# Глобальный экземпляр ленты изменений
+change_feed = ChangeFeed()
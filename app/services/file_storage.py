@@ -1,11 +1,13 @@
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 from minio import Minio
+from minio.deleteobjects import DeleteObject
 from minio.error import S3Error
 import uuid
 import os
 from fastapi import UploadFile, HTTPException
-from typing import Optional
-import aiofiles
+from typing import Optional, Dict, Iterable, BinaryIO
+from collections import OrderedDict
+import time
 from app.core.config import settings
 import logging
 import asyncio
@@ -13,6 +15,38 @@ from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
+# Сигнатуры (magic bytes) допустимых форматов изображений
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+def detect_image_type(head: bytes) -> Optional[str]:
+    """Определяет MIME-тип изображения по первым байтам файла"""
+    for signature, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+class SizeLimitedReader:
+    """Обертка над файлом, прерывающая чтение при превышении лимита размера"""
+
+    def __init__(self, stream: BinaryIO, max_size: int):
+        self.stream = stream
+        self.max_size = max_size
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.stream.read(size)
+        self.bytes_read += len(chunk)
+        if self.bytes_read > self.max_size:
+            raise HTTPException(status_code=413, detail="Image file is too large")
+        return chunk
+
 class FileStorage:
     def __init__(self):
         try:
@@ -25,6 +59,8 @@ class FileStorage:
             self.bucket_name = settings.MINIO_BUCKET_NAME
             self.public_url = settings.MINIO_PUBLIC_URL
             self.executor = ThreadPoolExecutor(max_workers=4)
+            # Кэш presigned URL: object_name -> (url, момент истечения по time.monotonic)
+            self._url_cache: "OrderedDict[str, tuple]" = OrderedDict()
             self._ensure_bucket_exists()
             logger.info(f"FileStorage initialized successfully for bucket: {self.bucket_name}")
         except Exception as e:
@@ -76,11 +112,11 @@ class FileStorage:
             raise HTTPException(status_code=500, detail="Failed to initialize storage")
 
     async def upload_image(self, file: UploadFile, product_id: uuid.UUID) -> Optional[str]:
-
+        """Загружает изображение в MinIO потоком, без промежуточных копий"""
         try:
             await file.seek(0)
         
-        # Валидация расширения файла
+            # Валидация расширения файла
             file_extension = os.path.splitext(file.filename)[1].lower() if file.filename else '.jpg'
             valid_extensions = ['.jpg', '.jpeg', '.png', '.webp', '.gif']
         
@@ -90,33 +126,33 @@ class FileStorage:
                     detail="Invalid file extension. Only .jpg, .jpeg, .png, .webp, .gif are allowed"
                 )
 
+            if file.size is not None and file.size > settings.MAX_IMAGE_SIZE:
+                raise HTTPException(status_code=413, detail="Image file is too large")
+
+            # Проверяем содержимое по первому фрагменту
+            head = await file.read(16)
+            content_type = detect_image_type(head)
+            if content_type is None:
+                raise HTTPException(status_code=400, detail="File content is not a supported image")
+            await file.seek(0)
+
             object_name = f"products/{product_id}{file_extension}"
-        
-            # Создаем временный файл (более надежный способ для больших файлов)
-            temp_file = f"/tmp/{uuid.uuid4()}{file_extension}"
-        
-            try:
-                # Сохраняем содержимое во временный файл
-                async with aiofiles.open(temp_file, 'wb') as out_file:
-                    content = await file.read()
-                    await out_file.write(content)
-
-                # Загружаем в MinIO используя fput_object (для файлов)
-                await self._run_in_thread(
-                    self.client.fput_object,
-                    self.bucket_name,
-                    object_name,
-                    temp_file,
-                    file.content_type or "image/jpeg"
-                )
-            
-                logger.info(f"Image uploaded successfully: {object_name}")
-                return object_name
-            
-            finally:
-                # Всегда удаляем временный файл
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
+
+            # Передаем файл в put_object напрямую: при известном размере - одним
+            # запросом, иначе multipart-загрузкой частями по UPLOAD_PART_SIZE
+            await self._run_in_thread(
+                self.client.put_object,
+                self.bucket_name,
+                object_name,
+                SizeLimitedReader(file.file, settings.MAX_IMAGE_SIZE),
+                file.size if file.size is not None else -1,
+                content_type=content_type,
+                part_size=0 if file.size is not None else settings.UPLOAD_PART_SIZE,
+                num_parallel_uploads=1
+            )
+
+            logger.info(f"Image uploaded successfully: {object_name}")
+            return object_name
                 
         except S3Error as e:
             logger.error(f"MinIO error uploading image for product {product_id}: {e}")
@@ -138,6 +174,7 @@ class FileStorage:
                 self.bucket_name,
                 object_name
             )
+            self.invalidate_image_url(object_name)
             logger.info(f"Image deleted successfully: {object_name}")
             return True
         except S3Error as e:
@@ -150,6 +187,69 @@ class FileStorage:
             logger.error(f"Unexpected error deleting image {object_name}: {e}")
             return False
 
+    async def delete_images(self, object_names: Iterable[Optional[str]]) -> int:
+        """Удаляет несколько изображений одним запросом к MinIO, возвращает число ошибок"""
+        names = sorted({name for name in object_names if name})
+        if not names:
+            return 0
+
+        def remove():
+            # remove_objects ленивый: запросы уходят при чтении результата
+            errors = self.client.remove_objects(
+                self.bucket_name,
+                (DeleteObject(name) for name in names)
+            )
+            return [error for error in errors if error.code != "NoSuchKey"]
+
+        try:
+            errors = await self._run_in_thread(remove)
+        except Exception as e:
+            logger.error(f"Unexpected error deleting {len(names)} images: {e}")
+            return len(names)
+        for name in names:
+            self.invalidate_image_url(name)
+        for error in errors:
+            logger.warning(f"MinIO error deleting image {error.name}: {error.message}")
+        logger.info(f"Deleted {len(names) - len(errors)} images")
+        return len(errors)
+
+    def _presign(self, object_name: str) -> Optional[str]:
+        """Возвращает presigned URL из кэша или подписывает новый"""
+        now = time.monotonic()
+        cached = self._url_cache.get(object_name)
+        if cached and cached[1] - now > settings.IMAGE_URL_REFRESH_MINUTES * 60:
+            self._url_cache.move_to_end(object_name)
+            return cached[0]
+
+        expires = timedelta(hours=settings.IMAGE_URL_EXPIRE_HOURS)
+        url = self.client.presigned_get_object(
+            self.bucket_name,
+            object_name,
+            expires=expires
+        )
+        self._url_cache[object_name] = (url, now + expires.total_seconds())
+        self._url_cache.move_to_end(object_name)
+        while len(self._url_cache) > settings.IMAGE_URL_CACHE_SIZE:
+            self._url_cache.popitem(last=False)
+        return url
+
+    def url_epoch(self, max_age: float = 0) -> Optional[datetime]:
+        """Начало текущего окна выдачи URL или None, если URL не меняются (development).
+
+        URL из _presign действует еще не меньше IMAGE_URL_REFRESH_MINUTES;
+        max_age - сколько он мог пролежать в кэше до выдачи. Окно выбрано
+        так, что выданные в нем URL действуют до его конца, поэтому ответ
+        с URL можно подтверждать (304), только пока окно не сменилось.
+        """
+        if settings.ENVIRONMENT == "development":
+            return None
+        window = max(settings.IMAGE_URL_REFRESH_MINUTES * 60 - max_age, 60)
+        return datetime.fromtimestamp(time.time() // window * window, tz=timezone.utc)
+
+    def invalidate_image_url(self, object_name: str) -> None:
+        """Удаляет URL объекта из кэша"""
+        self._url_cache.pop(object_name, None)
+
     def get_image_url(self, object_name: str) -> Optional[str]:
         """Возвращает URL для доступа к изображению"""
         if not object_name:
@@ -160,12 +260,8 @@ class FileStorage:
                 # Прямой URL для development
                 return f"{self.public_url}/{self.bucket_name}/{object_name}"
             else:
-                # Presigned URL для production
-                return self.client.presigned_get_object(
-                    self.bucket_name,
-                    object_name,
-                    expires=timedelta(hours=24)
-                )
+                # Presigned URL для production (с кэшированием до приближения к сроку истечения)
+                return self._presign(object_name)
         except S3Error as e:
             logger.error(f"MinIO error generating URL for {object_name}: {e}")
             return None
@@ -173,6 +269,18 @@ class FileStorage:
             logger.error(f"Unexpected error generating URL for {object_name}: {e}")
             return None
 
+    def get_image_urls(self, object_names: Iterable[Optional[str]]) -> Dict[str, Optional[str]]:
+        """Возвращает URL для набора изображений (например, для страницы товаров).
+
+        Каждый объект подписывается не более одного раза, при теплом кэше
+        подписи не вычисляются вовсе.
+        """
+        return {
+            name: self.get_image_url(name)
+            for name in dict.fromkeys(object_names)
+            if name
+        }
+
     async def image_exists(self, object_name: str) -> bool:
         """Проверяет существует ли изображение в хранилище"""
         if not object_name:
@@ -0,0 +1,172 @@
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+import time
+import uuid
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.database import async_session, read_session, replica_sessions
+from app.utils.cache import TwoTierCache, build_key
+from app.utils.serialization import type_adapter
+
+logger = logging.getLogger(__name__)
+
+# Тег всех списков каталога: любое изменение товара может их затронуть
+LIST_TAG = "products:list"
+# Версия каталога для ETag списков: "<время изменения>:<случайный токен>".
+# Токен случайный, поэтому после потери ключа в Redis версии не повторяются
+VERSION_KEY = "products:version"
+# Источник изменения для ленты изменений: записи CRUD сами сбрасывают кэш
+# и рассылают сброс, лента его не повторяет
+CHANGE_SOURCE = "api"
+
+
+def product_tag(product_id: uuid.UUID) -> str:
+    return f"product:{product_id}"
+
+
+def category_tag(category: str) -> str:
+    return f"category:{category}"
+
+
+class ProductCache:
+    """Кэш чтений каталога с тегами по товару и категории.
+
+    Записи CRUD-функций сбрасывают теги затронутых товаров и категорий,
+    сброс рассылается всем воркерам через Redis pub/sub.
+    """
+
+    def __init__(self):
+        self.cache = TwoTierCache(l1_ttl=settings.PRODUCT_CACHE_L1_TTL, namespace="products")
+
+    async def _read_session(self) -> AsyncSession:
+        """Сессия для заполнения кэша: реплика, если каталог давно не менялся.
+
+        Сразу после изменения реплика может еще не видеть его, и старое
+        значение попало бы в кэш на PRODUCT_CACHE_TTL, поэтому в течение
+        DB_READ_YOUR_WRITES_SECONDS после изменения читаем с основной БД.
+        """
+        if not replica_sessions:
+            return async_session()
+        version = await self.version()
+        recent = version is None or (
+            datetime.now(timezone.utc) - version[1]
+        ).total_seconds() < settings.DB_READ_YOUR_WRITES_SECONDS
+        return read_session(primary=recent)
+
+    async def get_or_load(
+        self,
+        name: str,
+        params: dict,
+        loader: Callable[[AsyncSession], Awaitable[Any]],
+        model: Any,
+        tags: Iterable[str]
+    ) -> Any:
+        """Результат loader(session) из кэша или из БД.
+
+        loader получает собственную сессию: при фоновом обновлении
+        сессия запроса уже может быть закрыта.
+        """
+        async def load():
+            async with await self._read_session() as session:
+                return await loader(session)
+
+        return await self.cache.get_or_set(
+            build_key(f"products:{name}", (), params),
+            load,
+            settings.PRODUCT_CACHE_TTL,
+            settings.PRODUCT_CACHE_STALE_TTL,
+            adapter=type_adapter(model),
+            tags=tags
+        )
+
+    def item_key(self, product_id: uuid.UUID) -> str:
+        """Ключ товара (тот же, что у get_or_load("item", ...) в GET /products/{id})"""
+        return build_key("products:item", (), {"product_id": product_id})
+
+    async def get_items(
+        self,
+        product_ids: List[uuid.UUID],
+        loader: Callable[[AsyncSession, List[uuid.UUID]], Awaitable[Dict[uuid.UUID, Any]]],
+        model: Any
+    ) -> Dict[uuid.UUID, Any]:
+        """Товары по id: найденные в кэше - из кэша, остальные одним вызовом loader"""
+        keys = {self.item_key(product_id): product_id for product_id in product_ids}
+        key_tags = {key: [product_tag(product_id)] for key, product_id in keys.items()}
+        adapter = type_adapter(model)
+        with self.cache.tracking(key_tags):
+            epoch = self.cache.epoch
+            cached = await self.cache.get_many(key_tags, adapter, settings.PRODUCT_CACHE_STALE_TTL)
+            items = {keys[key]: value for key, value in cached.items()}
+
+            missing = [product_id for product_id in product_ids if product_id not in items]
+            if missing:
+                async with await self._read_session() as session:
+                    loaded = await loader(session, missing)
+                items.update(loaded)
+                # Если за время загрузки был сброс, загруженное в кэш не кладем
+                if loaded and epoch == self.cache.epoch:
+                    await self.cache.set_many(
+                        {
+                            self.item_key(product_id): (item, [product_tag(product_id)])
+                            for product_id, item in loaded.items()
+                        },
+                        settings.PRODUCT_CACHE_TTL,
+                        settings.PRODUCT_CACHE_STALE_TTL
+                    )
+        return items
+
+    async def invalidate(
+        self,
+        product_id: Optional[uuid.UUID] = None,
+        categories: Iterable[Optional[str]] = (),
+        broadcast: bool = True
+    ) -> None:
+        """Сбрасывает кэш товара, его категорий и всех списков"""
+        await self.invalidate_many(
+            [product_id] if product_id is not None else [],
+            categories,
+            broadcast=broadcast
+        )
+
+    async def invalidate_many(
+        self,
+        product_ids: Iterable[uuid.UUID],
+        categories: Iterable[Optional[str]] = (),
+        broadcast: bool = True
+    ) -> None:
+        """Сбрасывает кэш нескольких товаров одним вызовом (массовые операции)"""
+        tags = [LIST_TAG]
+        tags += [product_tag(product_id) for product_id in set(product_ids)]
+        tags += [category_tag(category) for category in set(categories) if category]
+        await self.cache.invalidate_tags(*tags, broadcast=broadcast)
+        try:
+            await self.cache.redis.set(VERSION_KEY, _new_version())
+        except Exception as e:
+            logger.warning(f"Failed to bump catalog version: {e}")
+
+    async def version(self) -> Optional[Tuple[str, datetime]]:
+        """Текущая версия каталога и время его последнего изменения (None без Redis)"""
+        try:
+            value = await self.cache.redis.get(VERSION_KEY)
+            if value is None:
+                await self.cache.redis.set(VERSION_KEY, _new_version(), nx=True)
+                value = await self.cache.redis.get(VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"Failed to read catalog version: {e}")
+            return None
+        changed_at, token = value.decode().split(":")
+        return token, datetime.fromtimestamp(float(changed_at), tz=timezone.utc)
+
+    async def listen(self) -> None:
+        await self.cache.listen()
+
+
+def _new_version() -> str:
+    return f"{time.time()}:{uuid.uuid4().hex}"
+
+
+# Глобальный экземпляр кэша каталога
+product_cache = ProductCache()
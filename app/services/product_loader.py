@@ -0,0 +1,105 @@
+from typing import Dict, Iterable, Optional
+import asyncio
+import uuid
+
+from sqlalchemy import select, func, cast
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.product import Product
+
+_INFO_KEY = "product_loader"
+
+
+class ProductLoader:
+    """Пакетная загрузка товаров по id в рамках одной сессии (запроса).
+
+    Все id, запрошенные за один проход цикла событий, загружаются одним
+    SELECT ... WHERE id = ANY(...), результаты запоминаются до конца
+    запроса (None - товара нет). Запросы к сессии идут строго по одному:
+    id, запрошенные во время выборки, ждут ее и уходят следующей пачкой.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self._loaded: Dict[uuid.UUID, Optional[Product]] = {}
+        self._pending: Dict[uuid.UUID, asyncio.Future] = {}
+        self._dispatch_task: Optional[asyncio.Task] = None
+
+    def prime(self, product: Product) -> None:
+        """Запоминает уже загруженный товар"""
+        self._loaded[product.id] = product
+
+    def clear(self, product_ids: Optional[Iterable[uuid.UUID]] = None) -> None:
+        """Забывает товары (после их удаления или изменения в обход сессии)"""
+        if product_ids is None:
+            self._loaded.clear()
+            return
+        for product_id in product_ids:
+            self._loaded.pop(product_id, None)
+
+    async def load(self, product_id: uuid.UUID) -> Optional[Product]:
+        if product_id in self._loaded:
+            return self._loaded[product_id]
+
+        future = self._pending.get(product_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[product_id] = loop.create_future()
+            if self._dispatch_task is None:
+                # Задача стартует на следующем проходе цикла - к этому
+                # времени соберутся все id текущего прохода
+                self._dispatch_task = loop.create_task(self._dispatch())
+        # Future общий для всех, кто ждет этот товар: отмена одного из них
+        # не должна отменять его для остальных
+        return await asyncio.shield(future)
+
+    async def load_many(self, product_ids: Iterable[uuid.UUID]) -> Dict[uuid.UUID, Optional[Product]]:
+        product_ids = list(dict.fromkeys(product_ids))
+        products = await asyncio.gather(*(self.load(product_id) for product_id in product_ids))
+        return dict(zip(product_ids, products))
+
+    async def _dispatch(self) -> None:
+        try:
+            while self._pending:
+                pending, self._pending = self._pending, {}
+                await self._fetch(pending)
+        except asyncio.CancelledError:
+            pending, self._pending = self._pending, {}
+            for future in pending.values():
+                future.cancel()
+            raise
+        finally:
+            self._dispatch_task = None
+
+    async def _fetch(self, pending: Dict[uuid.UUID, asyncio.Future]) -> None:
+        try:
+            result = await self.db.execute(
+                select(Product).filter(
+                    Product.id == func.any(cast(list(pending), ARRAY(UUID(as_uuid=True))))
+                )
+            )
+            found = {product.id: product for product in result.scalars().all()}
+        except asyncio.CancelledError:
+            for future in pending.values():
+                future.cancel()
+            raise
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for product_id, future in pending.items():
+            product = found.get(product_id)
+            self._loaded[product_id] = product
+            if not future.done():
+                future.set_result(product)
+
+
+def product_loader(db: AsyncSession) -> ProductLoader:
+    """Загрузчик товаров, общий для всех вызовов с этой сессией"""
+    loader = db.info.get(_INFO_KEY)
+    if loader is None:
+        loader = db.info[_INFO_KEY] = ProductLoader(db)
+    return loader
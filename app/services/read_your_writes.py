@@ -0,0 +1,68 @@
+from typing import Optional
+import logging
+import time
+import uuid
+
+from app.core.config import settings
+from app.database import replica_sessions
+from app.utils.cache import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Сколько локальных меток держать до чистки истекших
+_LOCAL_LIMIT = 10000
+
+
+def _redis_key(user_id: uuid.UUID) -> str:
+    return f"db:primary:{user_id}"
+
+
+class ReadYourWrites:
+    """Окно чтения с основной БД после записи пользователя.
+
+    Реплика может отставать, поэтому пользователь, только что изменивший
+    данные, еще DB_READ_YOUR_WRITES_SECONDS читает с основной БД. Метка
+    хранится в Redis и видна всем воркерам; свой воркер помнит ее локально,
+    чтобы не обращаться к Redis. Без реплик ничего не делает.
+    """
+
+    def __init__(self):
+        self._local = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(replica_sessions) and settings.DB_READ_YOUR_WRITES_SECONDS > 0
+
+    async def mark(self, user_id: uuid.UUID) -> None:
+        """Отмечает запись пользователя"""
+        if not self.enabled:
+            return
+        window = settings.DB_READ_YOUR_WRITES_SECONDS
+        now = time.monotonic()
+        if len(self._local) >= _LOCAL_LIMIT:
+            self._local = {key: until for key, until in self._local.items() if until > now}
+        self._local[user_id] = now + window
+        try:
+            await redis_client.set(_redis_key(user_id), 1, px=max(int(window * 1000), 1))
+        except Exception as e:
+            logger.warning(f"Failed to mark primary reads for {user_id}: {e}")
+
+    async def use_primary(self, user_id: Optional[uuid.UUID]) -> bool:
+        """Должен ли пользователь сейчас читать с основной БД"""
+        if not self.enabled or user_id is None:
+            return False
+        until = self._local.get(user_id)
+        if until is not None:
+            if until > time.monotonic():
+                return True
+            del self._local[user_id]
+        try:
+            return bool(await redis_client.exists(_redis_key(user_id)))
+        except Exception as e:
+            # Без Redis нельзя проверить окно - читаем с основной БД
+            logger.warning(f"Failed to check primary reads for {user_id}: {e}")
+            return True
+
+
+# Глобальный экземпляр окна чтения своих записей
+read_your_writes = ReadYourWrites()
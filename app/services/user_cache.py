@@ -0,0 +1,54 @@
+from typing import Optional
+
+from app.core.config import settings
+from app.crud.user import get_user_by_email
+from app.database import async_session
+from app.schema.user import UserInDB
+from app.utils.cache import TwoTierCache
+from app.utils.serialization import type_adapter
+
+
+def _redis_key(email: str) -> str:
+    return f"user:{email}"
+
+
+class UserCache:
+    """Кэш пользователей по subject из JWT (email).
+
+    Поиск идет по цепочке: локальный LRU с коротким TTL -> Redis -> Postgres,
+    поэтому типичный аутентифицированный запрос не обращается к БД.
+    Одновременные промахи по одному пользователю дают один запрос к БД.
+    """
+
+    def __init__(self):
+        self.cache = TwoTierCache(
+            max_size=settings.USER_CACHE_SIZE,
+            l1_ttl=settings.USER_CACHE_LOCAL_TTL,
+            namespace="users"
+        )
+        self.adapter = type_adapter(UserInDB)
+
+    async def get(self, email: str) -> Optional[UserInDB]:
+        """Возвращает пользователя по email, по возможности без запроса к БД.
+
+        Промах читается в собственной сессии: загрузку могут ждать другие
+        запросы, и она не должна зависеть от сессии одного из них.
+        """
+        async def load():
+            async with async_session() as session:
+                return await get_user_by_email(session, email)
+
+        return await self.cache.get_or_set(
+            _redis_key(email),
+            load,
+            settings.USER_CACHE_TTL,
+            adapter=self.adapter
+        )
+
+    async def invalidate(self, email: str, broadcast: bool = True) -> None:
+        """Удаляет пользователя из кэша (после изменения его данных)"""
+        await self.cache.delete(_redis_key(email), broadcast=broadcast)
+
+
+# Глобальный экземпляр кэша пользователей
+user_cache = UserCache()
@@ -1,39 +1,539 @@
+from collections import OrderedDict
+from contextlib import contextmanager
 from functools import wraps
-from typing import Callable, Optional
-from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from datetime import date, datetime
+from enum import Enum
+from uuid import UUID
+import asyncio
+import hashlib
+import logging
+import struct
+import time
+import zlib
+
 from fastapi import Request, Response
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.config import settings
+import msgpack
+import orjson
 import redis.asyncio as redis
-import pickle
 
-redis_client = redis.from_url(settings.REDIS_URI)
+logger = logging.getLogger(__name__)
+
+redis_client = redis.from_url(str(settings.REDIS_URI))
+
+# Первый байт значения в кэше: формат и признак сжатия
+FORMAT_ORJSON = 0x01
+FORMAT_MSGPACK = 0x02
+FLAG_COMPRESSED = 0x80
+
+_KEY_TYPES = (str, int, float, bool, type(None), UUID, datetime, date, Enum)
+_SKIP_TYPES = (Request, Response, AsyncSession)
+
+
+def _is_model_payload(value: Any) -> bool:
+    if isinstance(value, BaseModel):
+        return True
+    return isinstance(value, (list, tuple)) and bool(value) and isinstance(value[0], BaseModel)
+
+
+def encode(value: Any) -> bytes:
+    """Сериализует значение для кэша.
+
+    Pydantic-модели (и списки моделей) - через orjson, примитивы - через
+    msgpack, значения больше CACHE_COMPRESS_THRESHOLD байт сжимаются zlib.
+    """
+    if _is_model_payload(value):
+        if isinstance(value, BaseModel):
+            data = value.model_dump(mode="python")
+        else:
+            data = [item.model_dump(mode="python") for item in value]
+        fmt, payload = FORMAT_ORJSON, orjson.dumps(data)
+    else:
+        try:
+            fmt, payload = FORMAT_MSGPACK, msgpack.packb(value, use_bin_type=True)
+        except TypeError:
+            # UUID, datetime и т.п. msgpack не умеет - их понимает orjson
+            fmt, payload = FORMAT_ORJSON, orjson.dumps(value)
+
+    if len(payload) > settings.CACHE_COMPRESS_THRESHOLD:
+        fmt |= FLAG_COMPRESSED
+        payload = zlib.compress(payload, settings.CACHE_COMPRESS_LEVEL)
+    return bytes([fmt]) + payload
+
+
+def decode(data: bytes, adapter: Optional[TypeAdapter] = None) -> Any:
+    """Восстанавливает значение из кэша (модели - через adapter, если он задан)"""
+    fmt, payload = data[0], data[1:]
+    if fmt & FLAG_COMPRESSED:
+        payload = zlib.decompress(payload)
+        fmt &= ~FLAG_COMPRESSED
+
+    if fmt == FORMAT_ORJSON:
+        value = orjson.loads(payload)
+    elif fmt == FORMAT_MSGPACK:
+        value = msgpack.unpackb(payload, raw=False)
+    else:
+        raise ValueError(f"Unknown cache format: {fmt}")
+
+    if adapter is not None:
+        return adapter.validate_python(value)
+    return value
+
+
+def _key_part(value: Any) -> Any:
+    """Значение аргумента для ключа или None, если аргумент в ключ не входит"""
+    if isinstance(value, _KEY_TYPES):
+        return value
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (list, tuple)):
+        return [_key_part(v) for v in value]
+    if isinstance(value, dict):
+        return sorted(([str(k), _key_part(v)] for k, v in value.items()), key=lambda item: item[0])
+    if isinstance(value, (set, frozenset)):
+        return sorted((_key_part(v) for v in value), key=lambda v: orjson.dumps(v, default=str))
+    # В ключ не входят только служебные объекты запроса
+    if isinstance(value, _SKIP_TYPES):
+        return None
+    # Иначе разные значения дали бы один ключ и чужой закэшированный ответ
+    raise TypeError(f"Cannot build cache key from {type(value).__name__} argument")
+
+
+def _tag_key(tag: str) -> str:
+    return f"tag:{tag}"
+
+
+def build_key(prefix: str, args: tuple, kwargs: dict) -> str:
+    """Детерминированный ключ: префикс + хеш значимых аргументов"""
+    parts = {
+        "args": [_key_part(arg) for arg in args],
+        "kwargs": {name: _key_part(value) for name, value in kwargs.items()},
+    }
+    digest = hashlib.blake2b(
+        orjson.dumps(parts, option=orjson.OPT_SORT_KEYS, default=str),
+        digest_size=16
+    ).hexdigest()
+    return f"{prefix}:{digest}"
+
+
+class TwoTierCache:
+    """Двухуровневый кэш: L1 в памяти процесса перед Redis (L2).
+
+    - L1 ограничен по размеру (LRU) и по времени жизни записи;
+    - одновременные промахи по одному ключу объединяются в одно вычисление
+      (single-flight);
+    - после истечения ttl значение еще stale_ttl секунд отдается как есть,
+      а обновляется в фоне одним воркером (stale-while-revalidate);
+    - записи можно пометить тегами и сбросить все записи тега сразу.
+      Сброс публикуется в Redis pub/sub (свой канал у каждого namespace),
+      и каждый воркер, в котором запущен listen(), удаляет эти записи из
+      своего L1.
+    """
+
+    # Заголовок значения в Redis: момент (time.time()), до которого оно свежее
+    _HEADER = struct.Struct(">d")
+
+    def __init__(
+        self,
+        client=None,
+        max_size: Optional[int] = None,
+        l1_ttl: Optional[float] = None,
+        namespace: str = "default"
+    ):
+        self.redis = client if client is not None else redis_client
+        self.channel = f"{settings.CACHE_INVALIDATION_CHANNEL}:{namespace}"
+        self.max_size = max_size or settings.CACHE_L1_SIZE
+        self.l1_ttl = l1_ttl if l1_ttl is not None else settings.CACHE_L1_TTL
+        # key -> (value, fresh_until, stale_until, l1_until, tags)
+        self._l1: "OrderedDict[str, tuple]" = OrderedDict()
+        # tag -> ключи L1 с этим тегом
+        self._tags: Dict[str, set] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._refreshing: set = set()
+        # Растет при сбросе записей L1 или загружаемых сейчас ключей: значение,
+        # вычисленное до сброса, не кэшируется
+        self._epoch = 0
+        # Загружаемые сейчас ключи и теги (с числом загрузок), см. tracking()
+        self._pending_keys: Dict[str, int] = {}
+        self._pending_tags: Dict[str, int] = {}
+
+    @contextmanager
+    def tracking(self, keys: Dict[str, Iterable[str]]):
+        """Отмечает ключи {ключ: теги} загружаемыми: их сброс до выхода меняет epoch"""
+        items = [(key, tuple(tags)) for key, tags in keys.items()]
+        names = [(self._pending_keys, key) for key, _ in items]
+        names += [(self._pending_tags, tag) for _, tags in items for tag in tags]
+        for counts, name in names:
+            counts[name] = counts.get(name, 0) + 1
+        try:
+            yield
+        finally:
+            for counts, name in names:
+                if counts[name] == 1:
+                    del counts[name]
+                else:
+                    counts[name] -= 1
+
+    def _l1_pop(self, key: str) -> None:
+        entry = self._l1.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[4]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def _l1_get(self, key: str) -> Optional[tuple]:
+        entry = self._l1.get(key)
+        if entry is None:
+            return None
+        if entry[3] < time.time():
+            self._l1_pop(key)
+            return None
+        self._l1.move_to_end(key)
+        return entry
+
+    def _l1_set(self, key: str, value: Any, fresh_until: float, stale_until: float, tags: tuple = ()) -> None:
+        self._l1_pop(key)
+        l1_until = min(stale_until, time.time() + self.l1_ttl)
+        self._l1[key] = (value, fresh_until, stale_until, l1_until, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._l1) > self.max_size:
+            self._l1_pop(next(iter(self._l1)))
+
+    async def _l2_get(self, key: str, adapter: Optional[TypeAdapter]) -> Optional[tuple]:
+        try:
+            data = await self.redis.get(key)
+        except Exception as e:
+            logger.warning(f"Cache read failed for {key}: {e}")
+            return None
+        if not data:
+            return None
+        try:
+            (fresh_until,) = self._HEADER.unpack_from(data)
+            return decode(data[self._HEADER.size:], adapter), fresh_until
+        except Exception as e:
+            # Битое или старого формата значение считаем промахом
+            logger.warning(f"Cache value for {key} is unreadable: {e}")
+            return None
+
+    async def _store(self, key: str, value: Any, ttl: float, stale_ttl: float, tags: tuple) -> None:
+        await self._store_many([(key, value, tags)], ttl, stale_ttl)
+
+    async def _store_many(self, items: List[Tuple[str, Any, tuple]], ttl: float, stale_ttl: float) -> None:
+        now = time.time()
+        fresh_until, stale_until = now + ttl, now + ttl + stale_ttl
+        expire_ms = max(int((ttl + stale_ttl) * 1000), 1)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, value, tags in items:
+                    try:
+                        payload = encode(value)
+                    except TypeError as e:
+                        logger.warning(f"Value for {key} is not cacheable: {e}")
+                        continue
+                    self._l1_set(key, value, fresh_until, stale_until, tags)
+                    pipe.set(key, self._HEADER.pack(fresh_until) + payload, px=expire_ms)
+                    for tag in tags:
+                        pipe.sadd(_tag_key(tag), key)
+                        # Множество тега живет не меньше самой долгой его записи
+                        pipe.pexpire(_tag_key(tag), expire_ms, gt=True)
+                        pipe.pexpire(_tag_key(tag), expire_ms, nx=True)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Cache write failed for {len(items)} keys: {e}")
+
+    async def _compute(self, key, loader, ttl, stale_ttl, tags) -> Any:
+        with self.tracking({key: tags}):
+            epoch = self._epoch
+            value = await loader()
+            if value is not None and epoch == self._epoch:
+                await self._store(key, value, ttl, stale_ttl, tags)
+        return value
+
+    def _computed(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Исключение получают ожидающие; если их не осталось, не логируем его повторно
+        if not task.cancelled():
+            task.exception()
+
+    async def _load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: float,
+        stale_ttl: float,
+        tags: tuple = ()
+    ) -> Any:
+        """Вычисляет значение; параллельные вызовы по тому же ключу ждут первый.
+
+        Вычисление идет в отдельной задаче: отмена запроса, который его
+        начал, не отменяет его для остальных ожидающих.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(
+                self._compute(key, loader, ttl, stale_ttl, tags)
+            )
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._computed(key, done))
+        return await asyncio.shield(task)
+
+    async def _revalidate(self, key, loader, ttl, stale_ttl, tags) -> None:
+        try:
+            # Между воркерами обновление координируется коротким замком в Redis
+            try:
+                locked = await self.redis.set(f"lock:{key}", b"1", nx=True, px=max(int(ttl * 1000), 1000))
+            except Exception:
+                locked = True
+            if not locked:
+                return
+            await self._load(key, loader, ttl, stale_ttl, tags)
+        except Exception as e:
+            logger.warning(f"Background refresh failed for {key}: {e}")
+        finally:
+            self._refreshing.discard(key)
+
+    def _schedule_revalidate(self, key, loader, ttl, stale_ttl, tags) -> None:
+        if key in self._refreshing or key in self._inflight:
+            return
+        self._refreshing.add(key)
+        asyncio.get_running_loop().create_task(self._revalidate(key, loader, ttl, stale_ttl, tags))
+
+    async def get_or_set(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: float,
+        stale_ttl: float = 0,
+        adapter: Optional[TypeAdapter] = None,
+        tags: Iterable[str] = (),
+        background: bool = True,
+    ) -> Any:
+        """Значение из L1/L2 или результат loader() (None не кэшируется).
+
+        background=False - устаревшее значение обновляется в самом вызове
+        (loader зависит от запроса и не может работать после него), а
+        отдается, только если обновить не удалось.
+        """
+        tags = tuple(tags)
+        now = time.time()
+        entry = self._l1_get(key)
+        if entry is not None:
+            value, fresh_until = entry[0], entry[1]
+            if fresh_until < now:
+                return await self._refresh(key, value, loader, ttl, stale_ttl, tags, background)
+            return value
+
+        with self.tracking({key: tags}):
+            epoch = self._epoch
+            cached = await self._l2_get(key, adapter)
+            if cached is not None and epoch == self._epoch:
+                self._l1_set(key, cached[0], cached[1], cached[1] + stale_ttl, tags)
+        if cached is not None:
+            value, fresh_until = cached
+            if fresh_until < now:
+                return await self._refresh(key, value, loader, ttl, stale_ttl, tags, background)
+            return value
+
+        return await self._load(key, loader, ttl, stale_ttl, tags)
+
+    async def _refresh(self, key, stale, loader, ttl, stale_ttl, tags, background: bool) -> Any:
+        if background:
+            self._schedule_revalidate(key, loader, ttl, stale_ttl, tags)
+            return stale
+        try:
+            return await self._load(key, loader, ttl, stale_ttl, tags)
+        except Exception as e:
+            logger.warning(f"Refresh failed for {key}, serving stale value: {e}")
+            return stale
+
+    @property
+    def epoch(self) -> int:
+        """Счетчик сбросов: если он изменился, загруженное ранее значение может быть устаревшим"""
+        return self._epoch
+
+    async def get_many(
+        self,
+        keys: Dict[str, Iterable[str]],
+        adapter: Optional[TypeAdapter] = None,
+        stale_ttl: float = 0
+    ) -> Dict[str, Any]:
+        """Свежие значения ключей {ключ: теги} из L1 и одним MGET из Redis.
+
+        Промахи и устаревшие значения не возвращаются.
+        """
+        now = time.time()
+        found: Dict[str, Any] = {}
+        missing = []
+        for key in keys:
+            entry = self._l1_get(key)
+            if entry is not None and entry[1] >= now:
+                found[key] = entry[0]
+            else:
+                missing.append(key)
+        if not missing:
+            return found
+
+        with self.tracking({key: keys[key] for key in missing}):
+            epoch = self._epoch
+            try:
+                values = await self.redis.mget(missing)
+            except Exception as e:
+                logger.warning(f"Cache read failed for {len(missing)} keys: {e}")
+                return found
+        for key, data in zip(missing, values):
+            if not data:
+                continue
+            try:
+                (fresh_until,) = self._HEADER.unpack_from(data)
+                if fresh_until < now:
+                    continue
+                value = decode(data[self._HEADER.size:], adapter)
+            except Exception as e:
+                logger.warning(f"Cache value for {key} is unreadable: {e}")
+                continue
+            if epoch == self._epoch:
+                self._l1_set(key, value, fresh_until, fresh_until + stale_ttl, tuple(keys[key]))
+            found[key] = value
+        return found
+
+    async def set_many(
+        self,
+        items: Dict[str, Tuple[Any, Iterable[str]]],
+        ttl: float,
+        stale_ttl: float = 0
+    ) -> None:
+        """Записывает значения {ключ: (значение, теги)} одним конвейером Redis"""
+        await self._store_many(
+            [(key, value, tuple(tags)) for key, (value, tags) in items.items()],
+            ttl,
+            stale_ttl
+        )
+
+    def delete_local(self, keys: Iterable[str] = (), tags: Iterable[str] = ()) -> None:
+        """Удаляет ключи и записи с тегами только из L1 этого процесса"""
+        matched = False
+        for key in keys:
+            matched = matched or key in self._l1 or key in self._pending_keys
+            self._l1_pop(key)
+        for tag in tags:
+            matched = matched or tag in self._tags or tag in self._pending_tags
+            for key in list(self._tags.get(tag, ())):
+                self._l1_pop(key)
+        if matched:
+            self._epoch += 1
+
+    def clear_local(self) -> None:
+        """Очищает L1 этого процесса целиком"""
+        self._epoch += 1
+        self._l1.clear()
+        self._tags.clear()
+
+    async def _publish(self, keys: list, tags: list) -> None:
+        try:
+            await self.redis.publish(
+                self.channel,
+                orjson.dumps({"keys": keys, "tags": tags})
+            )
+        except Exception as e:
+            logger.warning(f"Cache invalidation broadcast failed: {e}")
+
+    async def delete(self, *keys: str, broadcast: bool = True) -> None:
+        """Удаляет ключи из L1 и Redis во всех воркерах.
+
+        broadcast=False - не рассылать сброс (например, если о нем и так
+        узнает каждый воркер).
+        """
+        if not keys:
+            return
+        self.delete_local(keys)
+        try:
+            await self.redis.delete(*keys)
+        except Exception as e:
+            logger.warning(f"Cache delete failed for {keys}: {e}")
+        if broadcast:
+            await self._publish(list(keys), [])
+
+    async def invalidate_tags(self, *tags: str, broadcast: bool = True) -> None:
+        """Удаляет все записи с любым из тегов из L1 и Redis во всех воркерах"""
+        if not tags:
+            return
+        self.delete_local(tags=tags)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for tag in tags:
+                    pipe.smembers(_tag_key(tag))
+                members = await pipe.execute()
+            keys = {key for group in members for key in group}
+            await self.redis.delete(*keys, *(_tag_key(tag) for tag in tags))
+        except Exception as e:
+            logger.warning(f"Cache invalidation failed for tags {tags}: {e}")
+        if broadcast:
+            await self._publish([], list(tags))
+
+    async def listen(self) -> None:
+        """Применяет к L1 сбросы, опубликованные другими воркерами (работает до отмены)"""
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    data = orjson.loads(message["data"])
+                    self.delete_local(data.get("keys", ()), data.get("tags", ()))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener failed, reconnecting: {e}")
+                # Пока подписки не было, сообщения могли потеряться - L1 сбрасываем целиком
+                self.clear_local()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
+
+# Общий двухуровневый кэш для эндпоинтов
+two_tier_cache = TwoTierCache()
+
 
 def cache(
     expire: int = 60,
     key_prefix: Optional[str] = None,
+    model: Any = None,
+    stale_ttl: int = 0,
 ):
+    """Кэширует результат эндпоинта в двухуровневом кэше (память + Redis).
+
+    model - тип результата (например, List[ProductInDB]); если задан,
+    значение из Redis восстанавливается в него, иначе возвращаются
+    JSON-совместимые данные, которые FastAPI проверит по response_model.
+    stale_ttl - сколько секунд после истечения expire отдавать старое
+    значение, если обновить его не удалось. В фоне эндпоинт не обновляется:
+    его зависимости (сессия БД, запрос) живут только до конца запроса.
+    """
+    adapter = TypeAdapter(model) if model is not None else None
+
     def decorator(func: Callable):
+        prefix = key_prefix or f"{func.__module__}:{func.__name__}"
+
         @wraps(func)
         async def wrapper(request: Request, *args, **kwargs):
             # Генерируем ключ для кеша
-            cache_key = key_prefix or f"{func.__module__}:{func.__name__}"
-            cache_key += f":{str(args)}:{str(kwargs)}"
-            
-            # Пытаемся получить данные из кеша
-            cached_data = await redis_client.get(cache_key)
-            if cached_data:
-                return pickle.loads(cached_data)
-            
-            # Если данных нет в кеше, выполняем функцию
-            response = await func(request, *args, **kwargs)
-            
-            # Сохраняем результат в кеш
-            await redis_client.setex(
+            cache_key = build_key(prefix, args, kwargs)
+            return await two_tier_cache.get_or_set(
                 cache_key,
-                timedelta(seconds=expire),
-                pickle.dumps(response),
+                lambda: func(request, *args, **kwargs),
+                expire,
+                stale_ttl,
+                adapter,
+                background=False
             )
-            
-            return response
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
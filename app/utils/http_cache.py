@@ -0,0 +1,57 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+
+def make_etag(*parts) -> str:
+    """Слабый ETag из значимых частей (версии данных и параметров запроса)"""
+    raw = "|".join(str(part) for part in parts)
+    return f'W/"{hashlib.blake2b(raw.encode(), digest_size=12).hexdigest()}"'
+
+
+def _http_date(value: datetime) -> datetime:
+    # HTTP-даты имеют точность до секунды
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def _strip_weak(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """Проверяет If-None-Match / If-Modified-Since (If-None-Match приоритетнее)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        return _strip_weak(etag) in {_strip_weak(tag) for tag in if_none_match.split(",")}
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return _http_date(last_modified) <= _http_date(since)
+    return False
+
+
+def set_validators(response: Response, etag: str, last_modified: Optional[datetime] = None) -> None:
+    """Добавляет ETag и Last-Modified; клиент должен перепроверять ответ при каждом запросе"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    if last_modified is not None:
+        response.headers["Last-Modified"] = format_datetime(_http_date(last_modified), usegmt=True)
+
+
+def not_modified(etag: str, last_modified: Optional[datetime] = None) -> Response:
+    """Пустой ответ 304 с теми же валидаторами"""
+    response = Response(status_code=304)
+    set_validators(response, etag, last_modified)
+    return response
@@ -0,0 +1,39 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Tuple
+
+from fastapi import HTTPException
+
+
+def encode_cursor(created_at: datetime, item_id: uuid.UUID) -> str:
+    """Кодирует позицию (created_at, id) в непрозрачный курсор"""
+    raw = json.dumps([created_at.isoformat(), str(item_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """Декодирует курсор обратно в (created_at, id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, item_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), uuid.UUID(item_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_rank_cursor(score: float, item_id: uuid.UUID) -> str:
+    """Кодирует позицию (score, id) ранжированной выдачи в курсор"""
+    raw = json.dumps([score, str(item_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_rank_cursor(cursor: str) -> Tuple[float, uuid.UUID]:
+    """Декодирует курсор ранжированной выдачи в (score, id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        score, item_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return float(score), uuid.UUID(item_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
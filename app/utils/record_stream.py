@@ -0,0 +1,128 @@
+import codecs
+import csv
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+
+import orjson
+
+# Запись входного потока: (номер строки, данные или текст ошибки разбора)
+Record = Tuple[int, Union[Dict[str, object], str]]
+
+# Наибольшая длина строки (и записи CSV) в символах по умолчанию
+MAX_LINE_LENGTH = 1 << 20
+
+
+async def iter_lines(
+    chunks: AsyncIterator[bytes],
+    max_line_length: int = MAX_LINE_LENGTH
+) -> AsyncIterator[Optional[str]]:
+    """Разбивает поток байтов на строки UTF-8, не накапливая весь поток.
+
+    Строка длиннее max_line_length не собирается в памяти: ее остаток
+    пропускается до перевода строки, а вместо нее отдается None.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    parts: List[str] = []
+    size = 0
+    skipping = False
+
+    def split(text: str):
+        nonlocal parts, size, skipping
+        start = 0
+        while True:
+            end = text.find("\n", start)
+            piece = text[start:] if end == -1 else text[start:end]
+            if not skipping:
+                parts.append(piece)
+                size += len(piece)
+                if size > max_line_length:
+                    parts, size, skipping = [], 0, True
+                    yield None
+            if end == -1:
+                return
+            if not skipping:
+                yield "".join(parts).rstrip("\r")
+            parts, size, skipping = [], 0, False
+            start = end + 1
+
+    async for chunk in chunks:
+        for line in split(decoder.decode(chunk)):
+            yield line
+    for line in split(decoder.decode(b"", final=True)):
+        yield line
+    if parts and not skipping:
+        line = "".join(parts)
+        if line:
+            yield line.rstrip("\r")
+
+
+async def iter_csv_records(
+    chunks: AsyncIterator[bytes],
+    max_record_size: int = MAX_LINE_LENGTH
+) -> AsyncIterator[Record]:
+    """CSV с заголовком -> словари по колонкам.
+
+    Поле в кавычках может занимать несколько строк: строки копятся, пока
+    число кавычек в записи нечетное, но не больше max_record_size символов -
+    иначе одна незакрытая кавычка затянула бы в память весь остаток файла.
+    """
+    header = None
+    pending = []
+    pending_size = 0
+    quotes = 0
+    line_no = 0
+    async for line in iter_lines(chunks, max_record_size):
+        line_no += 1
+        record_line = line_no - len(pending)
+        if line is None:
+            pending, pending_size, quotes = [], 0, 0
+            yield record_line, f"Record exceeds {max_record_size} characters"
+            continue
+        pending.append(line)
+        pending_size += len(line) + 1
+        quotes += line.count('"')
+        if quotes % 2:
+            if pending_size > max_record_size:
+                pending, pending_size, quotes = [], 0, 0
+                yield record_line, f"Record exceeds {max_record_size} characters (unterminated quoted field?)"
+            continue
+
+        record = "\n".join(pending)
+        pending, pending_size, quotes = [], 0, 0
+        if not record.strip():
+            continue
+
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield record_line, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        yield record_line, dict(zip(header, values))
+
+    if pending:
+        yield line_no - len(pending) + 1, "Unterminated quoted field"
+
+
+async def iter_ndjson_records(
+    chunks: AsyncIterator[bytes],
+    max_line_length: int = MAX_LINE_LENGTH
+) -> AsyncIterator[Record]:
+    """NDJSON: по одному JSON-объекту в строке"""
+    line_no = 0
+    async for line in iter_lines(chunks, max_line_length):
+        line_no += 1
+        if line is None:
+            yield line_no, f"Line exceeds {max_line_length} characters"
+            continue
+        if not line.strip():
+            continue
+        try:
+            data = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            yield line_no, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(data, dict):
+            yield line_no, "Expected a JSON object"
+            continue
+        yield line_no, data
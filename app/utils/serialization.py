@@ -0,0 +1,78 @@
+from functools import lru_cache
+from typing import Any, AsyncIterator, List, Optional, Sequence
+
+import orjson
+from fastapi import Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import TypeAdapter
+
+_ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+# Форматы потоковых ответов и их типы содержимого
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "json": "application/json"}
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON-ответ через orjson.
+
+    Время в UTC пишется с суффиксом "Z", как у pydantic, поэтому ответы
+    побайтно совпадают с сериализацией моделей в режиме JSON.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=_ORJSON_OPTIONS)
+
+
+@lru_cache(maxsize=None)
+def type_adapter(tp: Any) -> TypeAdapter:
+    """TypeAdapter для типа (например, List[ProductInDB]), создается один раз на процесс"""
+    return TypeAdapter(tp)
+
+
+def model_response(
+    content: Any,
+    tp: Any,
+    response: Optional[Response] = None,
+    status_code: int = 200
+) -> ORJSONResponse:
+    """Ответ из уже проверенных моделей без повторной валидации по response_model.
+
+    FastAPI не обрабатывает возвращенный Response, поэтому модели один раз
+    превращаются в Python-значения адаптером tp (UUID и datetime orjson
+    пишет сам, это быстрее режима JSON в pydantic). Заголовки,
+    выставленные на внедренный response (ETag, Last-Modified), переносятся.
+    """
+    result = ORJSONResponse(type_adapter(tp).dump_python(content), status_code=status_code)
+    if response is not None:
+        result.raw_headers.extend(
+            (name, value) for name, value in response.raw_headers
+            if name not in (b"content-length", b"content-type")
+        )
+    return result
+
+
+async def _encode_stream(batches: AsyncIterator[Sequence[Any]], tp: Any, fmt: str) -> AsyncIterator[bytes]:
+    adapter = type_adapter(List[tp])
+    if fmt == "json":
+        yield b"["
+    first = True
+    async for batch in batches:
+        if not batch:
+            continue
+        rows = [orjson.dumps(item, option=_ORJSON_OPTIONS) for item in adapter.dump_python(batch)]
+        if fmt == "ndjson":
+            yield b"\n".join(rows) + b"\n"
+        else:
+            yield (b"" if first else b",") + b",".join(rows)
+        first = False
+    if fmt == "json":
+        yield b"]"
+
+
+def stream_response(batches: AsyncIterator[Sequence[Any]], tp: Any, fmt: str) -> StreamingResponse:
+    """Потоковый ответ из пачек моделей tp: NDJSON или один JSON-массив.
+
+    Каждая пачка пишется клиенту сразу после получения, поэтому память
+    не зависит от общего числа строк.
+    """
+    return StreamingResponse(_encode_stream(batches, tp, fmt), media_type=STREAM_MEDIA_TYPES[fmt])
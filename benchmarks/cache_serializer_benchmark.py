@@ -0,0 +1,75 @@
+"""Сравнение сериализаторов кэша: pickle против orjson/msgpack из app.utils.cache.
+
+Замеряет время кодирования и декодирования и размер значения для списка
+из 100 ProductInDB.
+
+Запуск:
+    python -m benchmarks.cache_serializer_benchmark
+"""
+import argparse
+import pickle
+import timeit
+import uuid
+from datetime import datetime, timezone
+from typing import List
+
+from pydantic import TypeAdapter
+
+from app.core.config import settings
+from app.schema.product import ProductInDB
+from app.utils.cache import encode, decode
+
+
+def make_products(count: int) -> List[ProductInDB]:
+    now = datetime.now(timezone.utc)
+    return [
+        ProductInDB(
+            id=uuid.uuid4(),
+            name=f"Кухонный гарнитур Модерн {i}",
+            description="Модульный кухонный гарнитур с фасадами из МДФ и фурнитурой Blum. " * 3,
+            price=45990.0 + i,
+            stock=i % 40,
+            category="Кухни",
+            sku=f"KG-{i:05d}",
+            weight=120.5,
+            dimensions="2400x600x2100",
+            image_object_name=f"products/{uuid.uuid4()}.jpeg",
+            image_url=f"http://localhost:9000/kitchen-blocks/products/{i}.jpeg",
+            is_active=True,
+            created_at=now,
+            updated_at=now,
+        )
+        for i in range(count)
+    ]
+
+
+def bench(label: str, dumps, loads, value, number: int):
+    payload = dumps(value)
+    encode_us = timeit.timeit(lambda: dumps(value), number=number) / number * 1e6
+    decode_us = timeit.timeit(lambda: loads(payload), number=number) / number * 1e6
+    print(f"  {label:<26} encode={encode_us:9.1f} us  decode={decode_us:9.1f} us  size={len(payload):7d} B")
+
+
+def run(count: int, number: int):
+    products = make_products(count)
+    adapter = TypeAdapter(List[ProductInDB])
+
+    print(f"{count} x ProductInDB, {number} iterations:")
+    bench("pickle", pickle.dumps, pickle.loads, products, number)
+    bench("orjson+zlib (raw data)", encode, decode, products, number)
+    bench("orjson+zlib (-> models)", encode, lambda data: decode(data, adapter), products, number)
+    dicts = [p.model_dump(mode="json") for p in products]
+    bench("msgpack+zlib (primitives)", encode, decode, dicts, number)
+
+    # Без сжатия: меньше CPU, больше трафика до Redis
+    settings.CACHE_COMPRESS_THRESHOLD = 1 << 30
+    bench("orjson (no compression)", encode, decode, products, number)
+    bench("msgpack (no compression)", encode, decode, dicts, number)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--number", type=int, default=500)
+    args = parser.parse_args()
+    run(args.count, args.number)
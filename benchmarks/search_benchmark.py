@@ -0,0 +1,104 @@
+"""Сравнение задержки поиска товаров: ILIKE против полнотекстового поиска.
+
+Наполняет таблицу products синтетическими товарами (категория "__bench__"),
+замеряет оба варианта запроса и удаляет тестовые данные.
+
+Запуск (нужна база с применёнными миграциями):
+    python -m benchmarks.search_benchmark --sizes 100000 1000000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import select, delete, text
+
+from app.crud.search import search_clause
+from app.database import async_session
+from app.models.product import Product
+
+BENCH_CATEGORY = "__bench__"
+QUERIES = ["кухонный гарнитур", "стол", "гарнитр", "oak table", "шкаф навесной"]
+
+SEED_SQL = text("""
+    INSERT INTO products (id, name, description, price, stock, is_active, category, weight)
+    SELECT
+        gen_random_uuid(),
+        (ARRAY['Кухонный гарнитур', 'Стол обеденный', 'Шкаф навесной', 'Oak table', 'Стул'])[1 + i % 5]
+            || ' ' || i,
+        'Синтетический товар номер ' || i || ' для замера поиска',
+        100 + i % 1000,
+        i % 50,
+        true,
+        :category,
+        1.0
+    FROM generate_series(1, :count) AS i
+""")
+
+
+def ilike_query(query: str, limit: int):
+    return (
+        select(Product.id)
+        .filter(
+            (Product.name.ilike(f"%{query}%")) | (Product.description.ilike(f"%{query}%")),
+            Product.is_active == True
+        )
+        # Порядок списка до полнотекстового поиска: обе стороны сортируют совпадения
+        .order_by(Product.created_at.desc(), Product.id.desc())
+        .limit(limit)
+    )
+
+
+def fts_query(query: str, limit: int):
+    condition, score = search_clause(query)
+    return (
+        select(Product.id)
+        .filter(condition, Product.is_active == True)
+        .order_by(score.desc(), Product.id.desc())
+        .limit(limit)
+    )
+
+
+async def measure(session, build, repeats: int, limit: int) -> list:
+    timings = []
+    for _ in range(repeats):
+        for query in QUERIES:
+            start = time.perf_counter()
+            await session.execute(build(query, limit))
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label: str, timings: list):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"  {label:<6} median={statistics.median(timings):8.2f} ms  p95={p95:8.2f} ms")
+
+
+async def run(sizes: list, repeats: int, limit: int):
+    async with async_session() as session:
+        for size in sizes:
+            await session.execute(delete(Product).where(Product.category == BENCH_CATEGORY))
+            await session.execute(SEED_SQL, {"category": BENCH_CATEGORY, "count": size})
+            await session.commit()
+            await session.execute(text("ANALYZE products"))
+
+            # Прогрев
+            await measure(session, ilike_query, 1, limit)
+            await measure(session, fts_query, 1, limit)
+
+            print(f"{size} products:")
+            report("ILIKE", await measure(session, ilike_query, repeats, limit))
+            report("FTS", await measure(session, fts_query, repeats, limit))
+
+        await session.execute(delete(Product).where(Product.category == BENCH_CATEGORY))
+        await session.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.repeats, args.limit))
@@ -0,0 +1,100 @@
+"""Сравнение путей сериализации списка товаров в ответ API.
+
+Старый путь: копирование атрибутов ORM в dict, ProductInDB(**dict) на
+каждый товар, повторная валидация по response_model и json.dumps в
+JSONResponse. Новый путь: одна валидация списка кэшированным TypeAdapter
+(from_attributes) и запись orjson без повторной валидации.
+
+URL изображений не подписываются (image_object_name пустой), чтобы
+замерять только сериализацию.
+
+Запуск:
+    python -m benchmarks.serialization_benchmark --sizes 100 1000
+"""
+import argparse
+import asyncio
+import timeit
+import uuid
+from datetime import datetime, timezone
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.crud.product import serialize_products
+from app.models.product import Product
+from app.schema.product import ProductInDB
+from app.utils.serialization import model_response
+
+
+def make_products(count: int) -> List[Product]:
+    now = datetime.now(timezone.utc)
+    return [
+        Product(
+            id=uuid.uuid4(),
+            name=f"Кухонный гарнитур Модерн {i}",
+            description="Модульный кухонный гарнитур с фасадами из МДФ и фурнитурой Blum. " * 3,
+            price=45990.0 + i,
+            stock=i % 40,
+            is_active=True,
+            category="Кухни",
+            sku=f"KG-{i:05d}",
+            weight=120.5,
+            dimensions="2400x600x2100",
+            image_object_name=None,
+            created_at=now,
+            updated_at=now,
+        )
+        for i in range(count)
+    ]
+
+
+def legacy_item(product: Product) -> ProductInDB:
+    """Прежний _add_image_url_to_product (без подписи URL)"""
+    return ProductInDB(**{
+        "id": product.id,
+        "name": product.name,
+        "description": product.description,
+        "price": product.price,
+        "stock": product.stock,
+        "is_active": product.is_active,
+        "category": product.category,
+        "sku": product.sku,
+        "weight": product.weight,
+        "dimensions": product.dimensions,
+        "image_object_name": product.image_object_name,
+        "created_at": product.created_at,
+        "updated_at": product.updated_at,
+        "image_url": None,
+    })
+
+
+def run(count: int, number: int):
+    products = make_products(count)
+    field = create_response_field(name="Response", type_=List[ProductInDB])
+    loop = asyncio.new_event_loop()
+
+    def legacy() -> bytes:
+        items = [legacy_item(product) for product in products]
+        content = loop.run_until_complete(serialize_response(field=field, response_content=items))
+        return JSONResponse(content).body
+
+    def fast() -> bytes:
+        return model_response(serialize_products(products, {}), List[ProductInDB]).body
+
+    print(f"{count} x Product, {number} iterations:")
+    for label, func in (("dict + response_model + json", legacy), ("TypeAdapter + orjson", fast)):
+        size = len(func())
+        total_ms = timeit.timeit(func, number=number) / number * 1e3
+        print(f"  {label:<30} {total_ms:8.2f} ms/response  {total_ms / count * 1e3:6.1f} us/item  size={size} B")
+    loop.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--number", type=int, default=50)
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.number)